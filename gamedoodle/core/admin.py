@@ -1,18 +1,29 @@
 from django.contrib import admin
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import mark_safe
 
 from gamedoodle.core.models import (
+    Activity,
+    Checkpoint,
     Comment,
     Event,
     EventGame,
     EventSubscription,
     Game,
+    Job,
     SentMail,
+    SteamAppDetails,
     Vote,
 )
 
 
+class ActivityAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "event", "kind", "actor", "game", "id")
+    list_filter = ("kind",)
+    raw_id_fields = ("event", "game")
+
+
 class SentMailAdmin(admin.ModelAdmin):
     list_display = (
         "recipient",
@@ -58,6 +69,9 @@ class EventAdmin(admin.ModelAdmin):
         "writable",
         "listed",
         "gameslist",
+        "num_participants",
+        "num_votes",
+        "num_comments",
         "uuid",
         "created_at",
         "modified_at",
@@ -78,16 +92,17 @@ class EventAdmin(admin.ModelAdmin):
 
     @mark_safe
     def gameslist(self, event):
-        html = "<ul>"
-        for eventgame in EventGame.objects.filter(event=event).order_by("game__name"):
-            suffix = ""
-            if eventgame.added_by_username:
-                suffix = f" <small style='color: grey'>added by <b>"
-                suffix += f"  {eventgame.added_by_username}</b></small>"
-            html += f"<li><a href='{eventgame.game.store_url}' target='_blank'>"
-            html += f"  {eventgame.game.name}"
+        html = "<ol>"
+        for game in Game.objects.with_event_score(event):
+            suffix = f" <small style='color: grey'>+{game.votes_value:g}"
+            if game.added_by_username:
+                suffix += f", added by <b>{game.added_by_username}</b>"
+            suffix += "</small>"
+            html += f"<li value='{game.voting_rank}'>"
+            html += f"<a href='{game.store_url}' target='_blank'>"
+            html += f"  {game.name}"
             html += f"</a>{suffix}</li>"
-        html += "</ul>"
+        html += "</ol>"
         return html
 
     @mark_safe
@@ -112,6 +127,31 @@ class GameAdmin(admin.ModelAdmin):
         )
 
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        "task",
+        "status",
+        "attempts",
+        "run_after",
+        "created_at",
+        "modified_at",
+        "id",
+    )
+    list_filter = ("status", "task")
+
+    def retry(self, request, queryset):
+        queryset.update(status=Job.PENDING, attempts=0, run_after=timezone.now())
+
+    retry.short_description = "Retry selected jobs"
+
+    actions = [retry]
+
+
+class SteamAppDetailsAdmin(admin.ModelAdmin):
+    list_display = ("appid", "created_at", "modified_at", "id")
+    search_fields = ("appid",)
+
+
 class VoteAdmin(admin.ModelAdmin):
     list_display = (
         "username",
@@ -143,6 +183,11 @@ class CommentAdmin(admin.ModelAdmin):
 
     visible.boolean = True
 
+
+class CheckpointAdmin(admin.ModelAdmin):
+    list_display = ("name", "value", "modified_at", "id")
+
+
 class EventGameAdmin(admin.ModelAdmin):
     list_display = ("event", "game", "added_by_username", "id")
     autocomplete_fields = ("event", "game")
@@ -151,10 +196,14 @@ class EventGameAdmin(admin.ModelAdmin):
 
 admin.site.site_header = "gamedoodle admin"
 
+admin.site.register(Activity, ActivityAdmin)
+admin.site.register(Checkpoint, CheckpointAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Event, EventAdmin)
 admin.site.register(EventGame, EventGameAdmin)
 admin.site.register(EventSubscription, EventSubscriptionAdmin)
 admin.site.register(Game, GameAdmin)
+admin.site.register(Job, JobAdmin)
 admin.site.register(SentMail, SentMailAdmin)
+admin.site.register(SteamAppDetails, SteamAppDetailsAdmin)
 admin.site.register(Vote, VoteAdmin)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = "gamedoodle.core"
+
+    def ready(self):
+        from gamedoodle.core import signals  # noqa: F401
@@ -0,0 +1,281 @@
+"""In-memory autocomplete for Game names.
+
+Keeps normalized Game names in memory, with entries for the start of
+each word in a name sorted by the text from there on, so suggestions are
+found by binary search instead of asking the database. If a prefix has
+no or few matches, prefixes within one typo of it are tried as well.
+
+To keep the memory footprint small, names are interned and truncated,
+Game ids and entries are stored in compact arrays and display names are
+loaded from the database only for the returned suggestions.
+
+The index is built lazily on first use and picks up Games that have
+been added meanwhile (e.g. by fetch_all_steam_games) incrementally. It
+is built again if Games in it have been renamed.
+
+Lookups do not take the lock: Names are only appended, and the sorted
+entries pointing to them are replaced as a whole, so a lookup always
+sees a consistent snapshot.
+
+"""
+import bisect
+import logging
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from datetime import datetime
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from gamedoodle.core.models import Game
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789 "
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and reduce punctuation to single spaces."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(
+        char if char.isalnum() else " "
+        for char in text
+        if not unicodedata.combining(char)
+    )
+    return " ".join(text.split())
+
+
+def _typo_variants(text: str, i: int) -> Iterable[str]:
+    """Texts with one deletion, substitution, insertion or transposition at i.
+
+    Substituting or appending a last character is left out, as every
+    prefix match for these is also one for deleting the last character.
+
+    """
+    yield text[:i] + text[i + 1 :]
+    if i + 1 < len(text):
+        yield text[:i] + text[i + 1] + text[i] + text[i + 2 :]
+        for char in ALPHABET:
+            if char != text[i]:
+                yield text[:i] + char + text[i + 1 :]
+        for char in ALPHABET:
+            yield text[:i] + char + text[i:]
+
+
+class _Entries(NamedTuple):
+    """Entry i points to names[self.names[i]], from character offsets[i] on."""
+
+    names: array
+    offsets: array
+
+
+class GameNameIndex:
+    def __init__(self, max_name_length: int = 64):
+        self.max_name_length = max_name_length
+        self.max_game_id = 0
+        self._lock = threading.Lock()
+        self._names: List[str] = []
+        self._game_ids = array("I")
+        self._entries = _Entries(array("I"), array("B"))
+
+    def __len__(self):
+        return len(self._names)
+
+    def _entry_key(self, entries: "_Entries", entry: int) -> str:
+        return self._names[entries.names[entry]][entries.offsets[entry] :]
+
+    def _new_entries(self, first_name: int) -> List[Tuple[str, int, int]]:
+        entries = []
+        for name_index in range(first_name, len(self._names)):
+            name = self._names[name_index]
+            for offset, char in enumerate(name):
+                if offset == 0 or name[offset - 1] == " ":
+                    entries.append((name[offset:], name_index, offset))
+        entries.sort()
+        return entries
+
+    def add(self, games: Iterable[Tuple[int, str]]):
+        """Add (game_id, name) pairs, merging them into the sorted entries."""
+        with self._lock:
+            first_name = len(self._names)
+            for game_id, name in games:
+                normalized = normalize(name)[: self.max_name_length]
+                if not normalized:
+                    continue
+                self._names.append(sys.intern(normalized))
+                self._game_ids.append(game_id)
+                self.max_game_id = max(self.max_game_id, game_id)
+
+            new_entries = self._new_entries(first_name)
+            if not new_entries:
+                return
+
+            old_entries = self._entries
+            merged = _Entries(array("I"), array("B"))
+            old = 0
+            num_old = len(old_entries.names)
+            for key, name_index, offset in new_entries:
+                while old < num_old and self._entry_key(old_entries, old) <= key:
+                    merged.names.append(old_entries.names[old])
+                    merged.offsets.append(old_entries.offsets[old])
+                    old += 1
+                merged.names.append(name_index)
+                merged.offsets.append(offset)
+            merged.names.extend(old_entries.names[old:])
+            merged.offsets.extend(old_entries.offsets[old:])
+            self._entries = merged
+
+    def get_name(self, game_id: int) -> Optional[str]:
+        """Normalized name of a Game in the index."""
+        # Games are added in the order of their ids.
+        name_index = bisect.bisect_left(self._game_ids, game_id)
+        if name_index < len(self._game_ids) and self._game_ids[name_index] == game_id:
+            return self._names[name_index]
+        return None
+
+    def _find(
+        self, entries: "_Entries", prefix: str, lo: int = 0, hi: Optional[int] = None
+    ) -> int:
+        if hi is None:
+            hi = len(entries.names)
+        return bisect.bisect_left(
+            range(len(entries.names)),
+            prefix,
+            lo,
+            hi,
+            key=lambda entry: self._entry_key(entries, entry),
+        )
+
+    def _prefix_range(self, entries: "_Entries", prefix: str) -> Tuple[int, int]:
+        """First and last + 1 entry starting with prefix."""
+        lo = self._find(entries, prefix)
+        return lo, self._find(entries, prefix + "\U0010ffff", lo)
+
+    def _prefix_matches(
+        self,
+        entries: "_Entries",
+        prefix: str,
+        game_ids: dict,
+        limit: int,
+        lo: int = 0,
+        hi: int = None,
+    ):
+        if hi is None:
+            hi = len(entries.names)
+        for entry in range(self._find(entries, prefix, lo, hi), hi):
+            if len(game_ids) >= limit or not self._entry_key(
+                entries, entry
+            ).startswith(prefix):
+                break
+            game_ids.setdefault(self._game_ids[entries.names[entry]], None)
+
+    def lookup(self, text: str, limit: int = 20) -> List[int]:
+        """Return ids of Games with a word starting with given text.
+
+        Ordered alphabetically by the name from the matching word on.
+
+        """
+        prefix = normalize(text)[: self.max_name_length]
+        if not prefix:
+            return []
+
+        # The same entries throughout, even if add() replaces them meanwhile.
+        entries = self._entries
+        # Used as an ordered set.
+        game_ids: dict = {}
+        self._prefix_matches(entries, prefix, game_ids, limit)
+        if len(game_ids) < limit and len(prefix) >= 3:
+            # Variants share the text before the typo, so only look for
+            # them among the entries starting with it. Typos after the
+            # longest known prefix can not lead to a match.
+            for i in range(len(prefix)):
+                lo, hi = self._prefix_range(entries, prefix[:i])
+                if lo == hi:
+                    break
+                for variant in _typo_variants(prefix, i):
+                    self._prefix_matches(entries, variant, game_ids, limit, lo, hi)
+                    if len(game_ids) >= limit:
+                        return list(game_ids)
+        return list(game_ids)
+
+    def memory_usage(self) -> int:
+        """Approximate number of bytes used by the index."""
+        return (
+            sys.getsizeof(self._names)
+            + sum(sys.getsizeof(name) for name in self._names)
+            + self._game_ids.itemsize * len(self._game_ids)
+            + self._entries.names.itemsize * len(self._entries.names)
+            + self._entries.offsets.itemsize * len(self._entries.offsets)
+        )
+
+
+_index: Optional[GameNameIndex] = None
+_index_lock = threading.Lock()
+_last_refresh: float = 0
+_last_refresh_at: Optional[datetime] = None
+
+
+def _load_games_since(index: GameNameIndex):
+    games = (
+        Game.objects.filter(id__gt=index.max_game_id)
+        .order_by("id")
+        .values_list("id", "name")
+    )
+    index.add(games.iterator(chunk_size=10000))
+
+
+def _has_renamed_games(index: GameNameIndex, since: datetime) -> bool:
+    """Whether Games in the index have been renamed, e.g. by an import."""
+    for game_id, name in (
+        Game.objects.filter(id__lte=index.max_game_id, modified_at__gte=since)
+        .values_list("id", "name")
+        .iterator()
+    ):
+        normalized = normalize(name)[: index.max_name_length]
+        if index.get_name(game_id) != (normalized or None):
+            return True
+    return False
+
+
+def _build_index() -> GameNameIndex:
+    index = GameNameIndex(settings.AUTOCOMPLETE["MAX_NAME_LENGTH"])
+    _load_games_since(index)
+    logger.info(
+        "Built autocomplete index for %d games using %d KiB",
+        len(index),
+        index.memory_usage() // 1024,
+    )
+    return index
+
+
+def get_index() -> GameNameIndex:
+    """Return the shared index, adding new Games from time to time."""
+    global _index, _last_refresh, _last_refresh_at
+    with _index_lock:
+        now = time.monotonic()
+        if _index is None:
+            _last_refresh_at = timezone.now()
+            _index = _build_index()
+            _last_refresh = now
+        elif now - _last_refresh > settings.AUTOCOMPLETE["REFRESH_SECONDS"]:
+            since, _last_refresh_at = _last_refresh_at, timezone.now()
+            if _has_renamed_games(_index, since):
+                _index = _build_index()
+            else:
+                _load_games_since(_index)
+            _last_refresh = now
+        return _index
+
+
+def suggest_games(text: str, limit: int = 20) -> List[Game]:
+    game_ids = get_index().lookup(text, limit)
+    games_by_id = Game.objects.in_bulk(game_ids)
+    return [games_by_id[game_id] for game_id in game_ids if game_id in games_by_id]
@@ -0,0 +1,53 @@
+"""Versioned caching of everything rendered for an Event.
+
+Each Event has a version that is bumped whenever anything shown on its
+page changes (see gamedoodle.core.signals). Cache keys include that
+version, so outdated entries are never read again and simply fall out
+of the LRU-bounded cache.
+
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache import caches
+
+
+def _get_versions_cache():
+    return caches["event-versions"]
+
+
+def _event_version_key(event_id: int) -> str:
+    return f"event-version:{event_id}"
+
+
+def get_event_version(event_id: int) -> int:
+    versions = _get_versions_cache()
+    version = versions.get(_event_version_key(event_id))
+    if version is None:
+        # Start from the current time instead of 0, so a version that
+        # has been evicted from the cache can not come back as an older
+        # value that still has fragments cached for it.
+        version = time.time_ns()
+        if not versions.add(_event_version_key(event_id), version, timeout=None):
+            version = versions.get(_event_version_key(event_id), version)
+    return version
+
+
+def bump_event_version(event_id: int) -> int:
+    version = time.time_ns()
+    _get_versions_cache().set(_event_version_key(event_id), version, timeout=None)
+    return version
+
+
+def get_event_cache_key(event_id: int, version: int, name: str) -> str:
+    return f"event:{event_id}:{version}:{name}"
+
+
+def get_or_set_event_cache(event_id: int, version: int, name: str, default):
+    """Get cached value for given Event version or store the result of default()."""
+    return cache.get_or_set(
+        get_event_cache_key(event_id, version, name),
+        default,
+        timeout=settings.EVENT_FRAGMENT_CACHE_TIMEOUT,
+    )
@@ -0,0 +1,144 @@
+"""Comment threads of an Event or of a Game on it, newest page first.
+
+Pages are fetched with a keyset cursor on (created_at, id) instead of an
+OFFSET, so showing the latest comments or loading older ones costs the
+same no matter how long the thread is. Alignment is stored on each
+Comment when it is created (see augment_comment_alignment), so a page
+can be rendered without looking at the rest of the thread.
+
+For overviews, get_comment_summaries() counts and previews all threads
+of an Event at once.
+
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Q
+from django.db.models import Window
+from django.db.models.functions import RowNumber
+from django.http import HttpRequest
+
+from gamedoodle.core.models import Comment
+from gamedoodle.core.models import Event
+from gamedoodle.core.models import Game
+
+COMMENTS_PER_PAGE = 50
+LATEST_COMMENTS_PER_THREAD = 3
+
+
+@dataclass
+class CommentPage:
+    comments: List[Comment]
+    """Oldest first."""
+    older_cursor: Optional[str] = None
+    """Pass as before to get the page of older comments, if any."""
+
+
+@dataclass
+class CommentSummary:
+    num_comments: int = 0
+    latest_comments: List[Comment] = field(default_factory=list)
+    """Oldest first, e.g. for previews."""
+
+
+def encode_cursor(comment: Comment) -> str:
+    return f"{comment.created_at.isoformat()}_{comment.id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raise ValueError for anything that is not from encode_cursor()."""
+    created_at, _, comment_id = cursor.rpartition("_")
+    return datetime.fromisoformat(created_at), int(comment_id)
+
+
+def get_comment_page(
+    event: Event,
+    game: Optional[Game] = None,
+    before: Optional[str] = None,
+    per_page: int = COMMENTS_PER_PAGE,
+) -> CommentPage:
+    """Visible comments of a thread, the newest ones or those before a cursor."""
+    comments = Comment.objects.filter(event=event, game=game, softdeleted=False)
+    if before:
+        created_at, comment_id = decode_cursor(before)
+        comments = comments.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=comment_id)
+        )
+    # One more to know whether there are older ones.
+    comments = list(comments.order_by("-created_at", "-id")[: per_page + 1])
+
+    has_older = len(comments) > per_page
+    comments = comments[:per_page][::-1]
+    for comment in comments:
+        comment.event = event
+        comment.game = game
+    return CommentPage(
+        comments=comments,
+        older_cursor=encode_cursor(comments[0]) if has_older else None,
+    )
+
+
+def get_latest_comment_page(
+    request: HttpRequest, event: Event, game: Optional[Game] = None
+) -> CommentPage:
+    """The newest comments of a thread, once per request."""
+    cache = request.__dict__.setdefault("_comment_pages", {})
+    key = (event.id, game.id if game else None)
+    if key not in cache:
+        cache[key] = get_comment_page(event, game)
+    return cache[key]
+
+
+def get_comment_summaries(
+    event: Event,
+    game_ids: Optional[Iterable[Optional[int]]] = None,
+    num_latest: int = LATEST_COMMENTS_PER_THREAD,
+) -> Dict[Optional[int], CommentSummary]:
+    """Number and latest visible comments of every thread of an Event.
+
+    Keys are Game ids, None for the general comments. Threads without
+    comments get an empty summary. Costs one query for all counts and
+    one for the latest comments of all threads, which can be skipped
+    with num_latest=0. Limit to some threads with game_ids.
+
+    """
+    comments = Comment.objects.filter(event=event, softdeleted=False)
+    if game_ids is not None:
+        game_ids = set(game_ids)
+        threads = Q(game_id__in=game_ids - {None})
+        if None in game_ids:
+            threads |= Q(game__isnull=True)
+        comments = comments.filter(threads)
+
+    summaries: Dict[Optional[int], CommentSummary] = defaultdict(CommentSummary)
+    for game_id, num_comments in (
+        comments.order_by().values("game_id").annotate(count=Count("id"))
+    ).values_list("game_id", "count"):
+        summaries[game_id].num_comments = num_comments
+
+    if num_latest:
+        latest_comments = (
+            comments.annotate(
+                position=Window(
+                    RowNumber(),
+                    partition_by=F("game_id"),
+                    order_by=[F("created_at").desc(), F("id").desc()],
+                )
+            )
+            .filter(position__lte=num_latest)
+            .only("created_at", "event_id", "game_id", "username", "text")
+            .order_by("created_at", "id")
+        )
+        for comment in latest_comments:
+            comment.event = event
+            summaries[comment.game_id].latest_comments.append(comment)
+    return summaries
@@ -0,0 +1,137 @@
+"""ETag and Last-Modified support for conditional GET requests.
+
+The values are derived from the newest modification of an Event and
+everything shown with it, using a single aggregate query. Clients that
+send If-None-Match for an unchanged Event get a 304 before any context
+is built.
+
+Use with django.views.decorators.http.condition, e.g.:
+
+    @condition(etag_func=event_etag, last_modified_func=event_last_modified)
+
+"""
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+from django.db.models import Count
+from django.db.models import Max
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import Subquery
+from django.http import HttpRequest
+
+from gamedoodle.core.models import Comment
+from gamedoodle.core.models import Event
+from gamedoodle.core.models import EventGame
+from gamedoodle.core.models import Vote
+
+
+def _aggregate_per_event(queryset, **aggregate):
+    """Scalar subquery aggregating given rows of the outer Event."""
+    ((name, expression),) = aggregate.items()
+    return Subquery(
+        queryset.filter(event=OuterRef("pk"))
+        .order_by()
+        .values("event")
+        .annotate(**{name: expression})
+        .values(name)
+    )
+
+
+def _get_event_freshness(request: HttpRequest, uuid) -> Optional[dict]:
+    """Newest modification and row counts of an Event, once per request.
+
+    Counts are included so deleting something also changes the ETag,
+    even though it does not leave a newer modified_at behind.
+
+    """
+    cache = request.__dict__.setdefault("_event_freshness", {})
+    if uuid not in cache:
+        cache[uuid] = (
+            Event.objects.filter(uuid=uuid)
+            .annotate(
+                votes_modified_at=_aggregate_per_event(
+                    Vote.objects.all(), value=Max("modified_at")
+                ),
+                comments_modified_at=_aggregate_per_event(
+                    Comment.objects.all(), value=Max("modified_at")
+                ),
+                event_games_modified_at=_aggregate_per_event(
+                    EventGame.objects.all(), value=Max("modified_at")
+                ),
+                games_modified_at=_aggregate_per_event(
+                    EventGame.objects.all(), value=Max("game__modified_at")
+                ),
+                num_visible_comments=_aggregate_per_event(
+                    Comment.objects.all(),
+                    value=Count("id", filter=Q(softdeleted=False)),
+                ),
+                num_games=_aggregate_per_event(
+                    EventGame.objects.all(), value=Count("id")
+                ),
+            )
+            .values(
+                "modified_at",
+                "votes_modified_at",
+                "comments_modified_at",
+                "event_games_modified_at",
+                "games_modified_at",
+                # Maintained by gamedoodle.core.counters.
+                "num_votes",
+                "num_visible_comments",
+                "num_games",
+            )
+            .first()
+        )
+    return cache[uuid]
+
+
+def _make_etag(request: HttpRequest, *parts) -> str:
+    """Hash given parts with everything else the response depends on."""
+    parts += (
+        request.session.get("username"),
+        bool(request.htmx),
+        request.get_full_path(),
+    )
+    return hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+
+
+def event_last_modified(request: HttpRequest, uuid, **kwargs) -> Optional[datetime]:
+    freshness = _get_event_freshness(request, uuid)
+    if freshness is None:
+        return None
+    return max(
+        value
+        for key, value in freshness.items()
+        if key.endswith("modified_at") and value is not None
+    )
+
+
+def event_etag(request: HttpRequest, uuid, **kwargs) -> Optional[str]:
+    freshness = _get_event_freshness(request, uuid)
+    if freshness is None:
+        return None
+    return _make_etag(request, uuid, sorted(freshness.items()))
+
+
+def _get_event_list_freshness(request: HttpRequest) -> dict:
+    """Newest modification and count of listed Events, once per request.
+
+    The list only shows the Events themselves, so their Votes, Comments
+    and Games are not taken into account here.
+
+    """
+    if not hasattr(request, "_event_list_freshness"):
+        request._event_list_freshness = Event.objects.filter(listed=True).aggregate(
+            modified_at=Max("modified_at"), num_events=Count("id")
+        )
+    return request._event_list_freshness
+
+
+def event_list_last_modified(request: HttpRequest, **kwargs) -> Optional[datetime]:
+    return _get_event_list_freshness(request)["modified_at"]
+
+
+def event_list_etag(request: HttpRequest, **kwargs) -> str:
+    return _make_etag(request, sorted(_get_event_list_freshness(request).items()))
@@ -0,0 +1,104 @@
+"""Denormalized counters of an Event, kept up to date on every write.
+
+Votes are counted incrementally, per username in EventParticipant and
+in total on the Event. Visible general comments are counted again with
+a single UPDATE whenever one changes, since soft-deleting does not tell
+what it was before. Receivers in gamedoodle.core.signals call these in
+the transaction of the write. The recount_events command repairs the
+counters after writes that bypass signals, e.g. bulk_create().
+
+"""
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.functions import Greatest
+
+from gamedoodle.core.models import Comment
+from gamedoodle.core.models import Event
+from gamedoodle.core.models import EventParticipant
+from gamedoodle.core.models import Vote
+
+
+def count_vote(event_id: int, username: str):
+    # Called in the transaction of the Vote, no need for a savepoint.
+    with transaction.atomic(savepoint=False):
+        participant, created = EventParticipant.objects.get_or_create(
+            event_id=event_id, username=username
+        )
+        EventParticipant.objects.filter(id=participant.id).update(
+            num_votes=F("num_votes") + 1
+        )
+        Event.objects.filter(id=event_id).update(
+            num_votes=F("num_votes") + 1,
+            num_participants=F("num_participants") + int(created),
+        )
+
+
+def uncount_vote(event_id: int, username: str):
+    with transaction.atomic():
+        participants = EventParticipant.objects.filter(
+            event_id=event_id, username=username
+        )
+        # Never below 0, even for Votes that were not counted.
+        participants.filter(num_votes__gt=0).update(num_votes=F("num_votes") - 1)
+        num_left, _ = participants.filter(num_votes=0).delete()
+        Event.objects.filter(id=event_id).update(
+            num_votes=Greatest(F("num_votes") - 1, 0),
+            num_participants=Greatest(F("num_participants") - num_left, 0),
+        )
+
+
+def _count_comments():
+    return Coalesce(
+        Subquery(
+            Comment.objects.filter(
+                event=OuterRef("id"), game__isnull=True, softdeleted=False
+            )
+            .values("event")
+            .annotate(count=Count("id"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def recount_comments(event_id: int):
+    Event.objects.filter(id=event_id).update(num_comments=_count_comments())
+
+
+def recount_event(event_id: int) -> bool:
+    """Count everything of an Event again, return whether anything was off."""
+    with transaction.atomic():
+        event = Event.objects.select_for_update().get(id=event_id)
+        counts_before = (event.num_votes, event.num_participants, event.num_comments)
+        participants_before = set(
+            event.eventparticipant_set.values_list("username", "num_votes")
+        )
+
+        participants = [
+            EventParticipant(event=event, username=username, num_votes=num_votes)
+            for username, num_votes in Vote.objects.filter(event=event)
+            .values("username")
+            .annotate(num_votes=Count("id"))
+            .values_list("username", "num_votes")
+        ]
+        event.eventparticipant_set.all().delete()
+        EventParticipant.objects.bulk_create(participants)
+
+        Event.objects.filter(id=event_id).update(
+            num_votes=sum(participant.num_votes for participant in participants),
+            num_participants=len(participants),
+            num_comments=_count_comments(),
+        )
+        event.refresh_from_db(
+            fields=["num_votes", "num_participants", "num_comments"]
+        )
+
+    counts_after = (event.num_votes, event.num_participants, event.num_comments)
+    participants_after = {
+        (participant.username, participant.num_votes) for participant in participants
+    }
+    return (counts_before, participants_before) != (counts_after, participants_after)
@@ -0,0 +1,237 @@
+"""Activity digests sent to the subscribers of an Event.
+
+Each run only looks at what happened since the previous one: Activity
+rows are scanned once from a high-water mark stored as Checkpoint,
+grouped by Event and rendered into one digest per Event, which is then
+sent to all active subscribers of that Event.
+
+Once the digest of an Event has been sent, that is recorded in its own
+Checkpoint, so if sending fails halfway, the next run only sends the
+digests that are still missing.
+
+Ids are handed out when rows are inserted, but rows become visible when
+their transaction commits, so an Activity with a lower id can show up
+after a higher one has been read. Runs therefore stop at the first
+Activity younger than SAFETY_LAG and leave it for the next run.
+
+"""
+import textwrap
+from collections import defaultdict
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import timedelta
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from django.contrib.sites.models import Site
+from django.db import transaction
+from django.db.models import Max
+from django.urls import reverse
+from django.utils import timezone
+
+from gamedoodle.core.mailing import GmailMailer
+from gamedoodle.core.models import Activity
+from gamedoodle.core.models import Checkpoint
+from gamedoodle.core.models import Comment
+from gamedoodle.core.models import Event
+from gamedoodle.core.models import EventSubscription
+
+LAST_ACTIVITY_ID_CHECKPOINT = "send_email_notifications.last_activity_id"
+# Followed by the Event id, for Events sent beyond the checkpoint above.
+EVENT_LAST_ACTIVITY_ID_CHECKPOINT_PREFIX = f"{LAST_ACTIVITY_ID_CHECKPOINT}.event."
+
+# How far to look back when there is no checkpoint yet.
+INITIAL_LOOKBACK = timedelta(days=1)
+
+# Longer than any transaction that writes Activity should take.
+SAFETY_LAG = timedelta(minutes=1)
+
+
+@dataclass
+class Digest:
+    """What happened on an Event since the last run."""
+
+    event: Event
+    descriptions: List[str] = field(default_factory=list)
+
+    def add(self, description: str):
+        # Voting back and forth should only be listed once.
+        if description not in self.descriptions:
+            self.descriptions.append(description)
+
+
+def get_last_activity_id() -> int:
+    value = Checkpoint.get_value(LAST_ACTIVITY_ID_CHECKPOINT)
+    if value:
+        return int(value)
+    since = timezone.now() - INITIAL_LOOKBACK
+    older = Activity.objects.filter(created_at__lt=since)
+    return older.aggregate(max_id=Max("id"))["max_id"] or 0
+
+
+def get_sent_activity_ids() -> Dict[int, int]:
+    """Last Activity id by Event id, for Events sent by an unfinished run."""
+    return {
+        int(name.removeprefix(EVENT_LAST_ACTIVITY_ID_CHECKPOINT_PREFIX)): int(value)
+        for name, value in Checkpoint.objects.filter(
+            name__startswith=EVENT_LAST_ACTIVITY_ID_CHECKPOINT_PREFIX
+        ).values_list("name", "value")
+    }
+
+
+def describe_activity(activity: Activity) -> str:
+    game_name = activity.game.name if activity.game else "a removed game"
+    if activity.kind == Activity.VOTE:
+        return f"{activity.actor} voted for {game_name}"
+    if activity.kind == Activity.UNVOTE:
+        return f"{activity.actor} removed their vote for {game_name}"
+    if activity.kind == Activity.SUPERLIKE:
+        return f"{activity.actor} superliked {game_name}"
+    if activity.kind == Activity.UNSUPERLIKE:
+        return f"{activity.actor} took back their superlike for {game_name}"
+    if activity.kind == Activity.ADD_GAME:
+        return f"{activity.actor or 'Someone'} added {game_name}"
+    if activity.game_id:
+        return (
+            f"{activity.actor} commented on {game_name}: "
+            f"{activity.payload['preview']}"
+        )
+    return f"{activity.actor} commented: {activity.payload['preview']}"
+
+
+def collect_digests(last_activity_id: int) -> Tuple[Dict[int, Digest], int]:
+    """Digests by Event id for all Activity after given id.
+
+    Returns the digests and the new last id, to continue from next time.
+
+    """
+    activities = list(
+        Activity.objects.filter(id__gt=last_activity_id)
+        # Old news, see the backfill_activities command.
+        .exclude(payload__has_key="backfilled")
+        .select_related("event", "game")
+        .order_by("id")
+    )
+    # Anything after a recent Activity may still be missing ids before it.
+    safe_before = timezone.now() - SAFETY_LAG
+    for index, activity in enumerate(activities):
+        if activity.created_at >= safe_before:
+            del activities[index:]
+            break
+    if not activities:
+        return {}, last_activity_id
+
+    softdeleted_comment_ids = set(
+        Comment.objects.filter(
+            id__in=[
+                activity.payload["comment_id"]
+                for activity in activities
+                if activity.kind == Activity.COMMENT
+            ],
+            softdeleted=True,
+        ).values_list("id", flat=True)
+    )
+
+    sent_activity_ids = get_sent_activity_ids()
+    digests: Dict[int, Digest] = {}
+    for activity in activities:
+        if activity.event.read_only:
+            continue
+        if activity.id <= sent_activity_ids.get(activity.event_id, 0):
+            continue
+        if activity.payload.get("comment_id") in softdeleted_comment_ids:
+            continue
+        digest = digests.setdefault(activity.event_id, Digest(activity.event))
+        digest.add(describe_activity(activity))
+
+    return digests, activities[-1].id
+
+
+def render_digest(digest: Digest, domain: str) -> Tuple[str, str, str]:
+    """Subject, text and html of a digest.
+
+    Contains an {unsubscription_url} placeholder for each subscriber.
+
+    """
+    event_url = domain + reverse("event-detail", args=[digest.event.uuid])
+    descriptions_text = "\n".join(
+        f"- {description}" for description in digest.descriptions
+    )
+    descriptions_html = "".join(
+        f"<li>{description}</li>" for description in digest.descriptions
+    )
+
+    subject = (
+        f'[gamedoodle] "{digest.event.name}" has '
+        f"seen some recent activity, check it out"
+    )
+    text = (
+        "Here are a few of the things that happened:\n\n"
+        f"{descriptions_text}\n\n"
+        f"Go to event: {event_url}\n\n"
+        "Unsubscribe from these notifications: {unsubscription_url}\n"
+    )
+    html = textwrap.dedent(
+        f"""
+        Here are a few of the things that happened:
+
+        <ul>{descriptions_html}</ul>
+
+        <a href="{event_url}"><h3>Go to event</h3></a>
+
+        <p>
+           <small>
+             <a href="{{unsubscription_url}}">Unsubscribe from these notifications</a>.
+           </small>
+        </p>
+    """
+    )
+    return subject, text, html
+
+
+def send_digests() -> int:
+    """Send digests of everything since the last run, return number of emails."""
+    digests, last_activity_id = collect_digests(get_last_activity_id())
+
+    subscriptions_by_event_id = defaultdict(list)
+    for subscription in EventSubscription.objects.filter(
+        active=True, event_id__in=digests.keys()
+    ):
+        subscriptions_by_event_id[subscription.event_id].append(subscription)
+
+    domain = Site.objects.get_current().domain
+    num_sent = 0
+    with GmailMailer() as mailer:
+        for event_id, subscriptions in subscriptions_by_event_id.items():
+            subject, text, html = render_digest(digests[event_id], domain)
+            for subscription in subscriptions:
+                unsubscription_url = domain + reverse(
+                    "event-notifications-unsubscribe", args=[subscription.uuid]
+                )
+                mailer.send(
+                    recipient=subscription.email,
+                    subject=subject,
+                    body=text.replace("{unsubscription_url}", unsubscription_url),
+                    html=html.replace("{unsubscription_url}", unsubscription_url),
+                )
+                num_sent += 1
+            # In a single query, unlike Checkpoint.set_value().
+            Checkpoint.objects.bulk_create(
+                [
+                    Checkpoint(
+                        name=f"{EVENT_LAST_ACTIVITY_ID_CHECKPOINT_PREFIX}{event_id}",
+                        value=str(last_activity_id),
+                    )
+                ],
+                update_conflicts=True,
+                unique_fields=["name"],
+                update_fields=["value", "modified_at"],
+            )
+
+    with transaction.atomic():
+        Checkpoint.set_value(LAST_ACTIVITY_ID_CHECKPOINT, str(last_activity_id))
+        Checkpoint.objects.filter(
+            name__startswith=EVENT_LAST_ACTIVITY_ID_CHECKPOINT_PREFIX
+        ).delete()
+    return num_sent
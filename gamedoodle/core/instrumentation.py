@@ -0,0 +1,192 @@
+"""Per request numbers on SQL queries, template rendering and total time.
+
+With settings.INSTRUMENTATION["ENABLED"], InstrumentationMiddleware adds
+them to each response as Server-Timing header (shown in the network tab
+of the browser's developer tools) and logs them as one line per request
+to the gamedoodle.core.instrumentation logger at level INFO, with the
+numbers in extra for structured log handlers.
+
+Views with a budget in INSTRUMENTATION["QUERY_BUDGETS"] (by URL name)
+log a warning when they make more queries. With ENFORCE_QUERY_BUDGETS
+they raise QueryBudgetExceeded instead, which QueryBudgetTestRunner
+turns on so that tests fail.
+
+When disabled the middleware removes itself from the chain at startup,
+so it costs nothing per request.
+
+"""
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+from django.test.runner import DiscoverRunner
+from django.test.utils import iter_test_cases
+from django.test.utils import override_settings
+
+logger = logging.getLogger(__name__)
+
+_current_metrics: ContextVar[Optional["RequestMetrics"]] = ContextVar(
+    "current_metrics", default=None
+)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@dataclass
+class RequestMetrics:
+    num_queries: int = 0
+    sql_seconds: float = 0.0
+    template_seconds: float = 0.0
+    total_seconds: float = 0.0
+    _template_depth: int = 0
+
+    def count_query(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.num_queries += 1
+            self.sql_seconds += time.perf_counter() - started_at
+
+    def as_server_timing(self) -> str:
+        sql_ms = self.sql_seconds * 1000
+        return ", ".join(
+            [
+                f'sql;desc="{self.num_queries} queries";dur={sql_ms:.1f}',
+                f"template;dur={self.template_seconds * 1000:.1f}",
+                f"total;dur={self.total_seconds * 1000:.1f}",
+            ]
+        )
+
+
+def _timed_template_render(render):
+    def wrapper(self, context):
+        metrics = _current_metrics.get()
+        if metrics is None:
+            return render(self, context)
+
+        # Included templates are part of the outermost one.
+        metrics._template_depth += 1
+        started_at = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            metrics._template_depth -= 1
+            if not metrics._template_depth:
+                metrics.template_seconds += time.perf_counter() - started_at
+
+    wrapper.is_timed = True
+    return wrapper
+
+
+class InstrumentationMiddleware:
+    """Measure each request, keep first in settings.MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION["ENABLED"]:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if not getattr(Template.render, "is_timed", False):
+            Template.render = _timed_template_render(Template.render)
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        started_at = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.count_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.total_seconds = time.perf_counter() - started_at
+            _current_metrics.reset(token)
+
+        response["Server-Timing"] = metrics.as_server_timing()
+        view_name = getattr(request.resolver_match, "url_name", None)
+        logger.info(
+            "%s %s %s view=%s queries=%d sql_ms=%.1f template_ms=%.1f total_ms=%.1f",
+            request.method,
+            request.path,
+            response.status_code,
+            view_name,
+            metrics.num_queries,
+            metrics.sql_seconds * 1000,
+            metrics.template_seconds * 1000,
+            metrics.total_seconds * 1000,
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "status_code": response.status_code,
+                "view_name": view_name,
+                "num_queries": metrics.num_queries,
+                "sql_ms": round(metrics.sql_seconds * 1000, 1),
+                "template_ms": round(metrics.template_seconds * 1000, 1),
+                "total_ms": round(metrics.total_seconds * 1000, 1),
+            },
+        )
+        self.check_query_budget(view_name, metrics.num_queries)
+        return response
+
+    def check_query_budget(self, view_name: Optional[str], num_queries: int):
+        budget = settings.INSTRUMENTATION["QUERY_BUDGETS"].get(view_name)
+        if budget is None or num_queries <= budget:
+            return
+        message = f"{view_name} made {num_queries} queries, budget is {budget}"
+        if settings.INSTRUMENTATION["ENFORCE_QUERY_BUDGETS"]:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+def _clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """Fail tests with requests to views that exceed their query budget.
+
+    Tests also get in-memory caches that are cleared after each test,
+    since database ids and so event versions are reused between tests.
+
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._instrumentation = override_settings(
+            INSTRUMENTATION={
+                **settings.INSTRUMENTATION,
+                "ENABLED": True,
+                "ENFORCE_QUERY_BUDGETS": True,
+            },
+            CACHES={
+                alias: {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": f"tests-{alias}",
+                }
+                for alias in settings.CACHES
+            },
+        )
+        self._instrumentation.enable()
+
+    def build_suite(self, *args, **kwargs):
+        suite = super().build_suite(*args, **kwargs)
+        for test in iter_test_cases(suite):
+            test.addCleanup(_clear_caches)
+        return suite
+
+    def teardown_test_environment(self, **kwargs):
+        self._instrumentation.disable()
+        super().teardown_test_environment(**kwargs)
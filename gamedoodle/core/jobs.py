@@ -0,0 +1,115 @@
+"""A small job queue backed by the Job table.
+
+Register a function as task and enqueue calls to it from anywhere:
+
+    @task
+    def enrich_game(game_id): ...
+
+    enqueue(enrich_game, game_id=1)
+
+Jobs are run by the run_worker management command. Failed jobs are
+retried with exponential backoff and end up with status Job.DEAD after
+too many attempts, for someone to have a look at them in the admin.
+
+Tasks run outside of a transaction, so that slow calls to Steam or the
+mail server do not keep SQLite locked for writers. Tasks that write more
+than one row use their own transaction.atomic() around the writes.
+
+"""
+import logging
+import traceback
+from datetime import timedelta
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from gamedoodle.core.models import Job
+
+logger = logging.getLogger(__name__)
+
+_tasks: Dict[str, Callable] = {}
+
+
+def task(func: Callable) -> Callable:
+    """Register function so it can be enqueued and run by the worker."""
+    _tasks[func.__name__] = func
+    return func
+
+
+def enqueue(func: Callable, **kwargs) -> Job:
+    """Add a Job to run given task with kwargs (must be JSON serializable)."""
+    if _tasks.get(func.__name__) is not func:
+        raise ValueError(f"{func.__name__} is not registered as task")
+    return Job.objects.create(
+        task=func.__name__,
+        kwargs=kwargs,
+        max_attempts=settings.JOB_QUEUE["MAX_ATTEMPTS"],
+    )
+
+
+def claim_next_job() -> Optional[Job]:
+    """Mark the next due Job as running and return it.
+
+    Uses a conditional UPDATE, so several worker threads or processes
+    never get the same Job.
+
+    """
+    while True:
+        job = (
+            Job.objects.filter(status=Job.PENDING, run_after__lte=timezone.now())
+            .order_by("run_after", "id")
+            .first()
+        )
+        if job is None:
+            return None
+        num_claimed = Job.objects.filter(id=job.id, status=Job.PENDING).update(
+            status=Job.RUNNING, started_at=timezone.now()
+        )
+        if num_claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job: Job):
+    try:
+        _tasks[job.task](**job.kwargs)
+    except Exception:
+        job.attempts += 1
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.DEAD
+            logger.error("Job %s failed for good:\n%s", job, job.last_error)
+        else:
+            job.status = Job.PENDING
+            backoff_seconds = settings.JOB_QUEUE["RETRY_BACKOFF_SECONDS"] * (
+                2 ** (job.attempts - 1)
+            )
+            job.run_after = timezone.now() + timedelta(seconds=backoff_seconds)
+            logger.warning("Job %s failed, retrying in %ss", job, backoff_seconds)
+    else:
+        job.attempts += 1
+        job.status = Job.DONE
+    job.save(
+        update_fields=["attempts", "status", "run_after", "last_error", "modified_at"]
+    )
+
+
+def get_unfinished_jobs(func: Callable) -> QuerySet:
+    """Jobs of given task that are still pending or running."""
+    return Job.objects.filter(
+        task=func.__name__, status__in=[Job.PENDING, Job.RUNNING]
+    )
+
+
+def requeue_stale_jobs() -> int:
+    """Make Jobs pending again that were running when a worker died."""
+    stale_before = timezone.now() - timedelta(
+        seconds=settings.JOB_QUEUE["STALE_SECONDS"]
+    )
+    return Job.objects.filter(status=Job.RUNNING, started_at__lt=stale_before).update(
+        status=Job.PENDING
+    )
@@ -0,0 +1,257 @@
+"""Live updates for Event pages via Server-Sent Events.
+
+Changes are published per Event (see gamedoodle.core.signals) to an
+in-process broker that fans them out to the asyncio queues of all
+connected clients. If settings.LIVE_UPDATES["REDIS_URL"] is set, changes
+are published via redis instead, so all worker processes receive them.
+
+Clients get small htmx-swappable fragments:
+
+- "game-<id>": The card of a Game that changed.
+- "game-rank-<id>": The rank label of a Game whose rank changed.
+- "game-order": The order of the cards, see event_game_order.html.
+- "event-changed": Something else changed, reload the whole content.
+
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import AsyncIterator
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from gamedoodle.core.caching import get_event_version
+from gamedoodle.core.models import Event
+from gamedoodle.core.scoreboard import build_scoreboard
+
+REDIS_CHANNEL_PREFIX = "gamedoodle:event:"
+
+
+class Subscription:
+    """Queue of changes of one Event for one connected client."""
+
+    def __init__(self, event_id: int):
+        self.event_id = event_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(
+            maxsize=settings.LIVE_UPDATES["QUEUE_SIZE"]
+        )
+
+    def put_threadsafe(self, message: dict):
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message: dict):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The client can not keep up, just let it reload everything.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"event_id": self.event_id, "game_id": None})
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    """In-process fan-out of Event changes to Subscriptions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[int, Set[Subscription]] = defaultdict(set)
+
+    def subscribe(self, event_id: int) -> Subscription:
+        subscription = Subscription(event_id)
+        with self._lock:
+            self._subscriptions[event_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions[subscription.event_id]
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.event_id]
+
+    def publish(self, event_id: int, game_id: Optional[int] = None):
+        """Publish change of an Event, game_id None means the Event itself."""
+        self.dispatch({"event_id": event_id, "game_id": game_id})
+
+    def dispatch(self, message: dict):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(message["event_id"], ()))
+        for subscription in subscriptions:
+            subscription.put_threadsafe(message)
+
+
+class RedisEventBroker(EventBroker):
+    """Share changes between worker processes using redis pub/sub."""
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def subscribe(self, event_id: int) -> Subscription:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return super().subscribe(event_id)
+
+    def publish(self, event_id: int, game_id: Optional[int] = None):
+        import redis
+
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.url)
+        self._redis.publish(
+            f"{REDIS_CHANNEL_PREFIX}{event_id}",
+            json.dumps({"event_id": event_id, "game_id": game_id}),
+        )
+
+    async def _listen(self):
+        import redis.asyncio
+
+        pubsub = redis.asyncio.Redis.from_url(self.url).pubsub()
+        await pubsub.psubscribe(f"{REDIS_CHANNEL_PREFIX}*")
+        async for item in pubsub.listen():
+            if item["type"] == "pmessage":
+                self.dispatch(json.loads(item["data"]))
+
+
+_broker: Optional[EventBroker] = None
+
+
+def get_broker() -> EventBroker:
+    global _broker
+    if _broker is None:
+        redis_url = settings.LIVE_UPDATES["REDIS_URL"]
+        _broker = RedisEventBroker(redis_url) if redis_url else EventBroker()
+    return _broker
+
+
+def _format_sse(name: str, data: str) -> str:
+    lines = "".join(f"data: {line}\n" for line in data.splitlines() or [""])
+    return f"event: {name}\n{lines}\n"
+
+
+def render_game_updates(
+    event: Event,
+    username: str,
+    game_ids: Set[int],
+    ranks: Dict[int, int],
+    swap_oob: bool = False,
+) -> Optional[List[Tuple[str, str]]]:
+    """Render what changed on the scoreboard since ranks, as (name, html).
+
+    - "game-<id>": The cards of given Games.
+    - "game-rank-<id>": The rank labels of other Games whose rank changed.
+    - "game-order": The order of all cards, if it changed.
+
+    Updates ranks in place with the current ranks, in scoreboard order.
+
+    With swap_oob the fragments are marked for htmx out-of-band swaps.
+
+    Returns None if the number of participants differs from the one of
+    event. That changes the header and the superlike weight in the votes
+    of every card, so everything has to be rendered again.
+
+    """
+    event_version = get_event_version(event.id)
+    games = build_scoreboard(event, username, event_version)
+    if games and games[0].num_event_participants != event.num_participants:
+        return None
+    order_changed = list(ranks) != [game.id for game in games]
+    ranks_before = dict(ranks)
+    ranks.clear()
+
+    updates = []
+    for game in games:
+        ranks[game.id] = game.voting_rank
+        context = {
+            "event": event,
+            "game": game,
+            "username": username,
+            "event_version": event_version,
+            "fragment_cache_timeout": settings.EVENT_FRAGMENT_CACHE_TIMEOUT,
+            "swap_oob": swap_oob,
+        }
+        if game.id in game_ids:
+            html = render_to_string("core/event_game_card.html", context)
+            updates.append((f"game-{game.id}", html))
+        elif ranks_before.get(game.id) != game.voting_rank:
+            html = render_to_string("core/event_game_rank.html", context)
+            updates.append((f"game-rank-{game.id}", html))
+
+    if order_changed:
+        html = render_to_string(
+            "core/event_game_order.html", {"games": games, "swap_oob": swap_oob}
+        )
+        updates.append(("game-order", html))
+    return updates
+
+
+def get_ranks(event: Event) -> Dict[int, int]:
+    """Ranks by Game id, in scoreboard order."""
+    return {
+        game.id: game.voting_rank
+        for game in build_scoreboard(event, None, get_event_version(event.id))
+    }
+
+
+async def stream_event_updates(event: Event, username: str) -> AsyncIterator[str]:
+    """Yield Server-Sent Events for changes of given Event.
+
+    The stream ends after settings.LIVE_UPDATES["MAX_SECONDS"], clients
+    reconnect automatically. This makes sure streams of clients that
+    went away without us noticing do not live forever.
+
+    """
+    broker = get_broker()
+    subscription = broker.subscribe(event.id)
+    keepalive_seconds = settings.LIVE_UPDATES["KEEPALIVE_SECONDS"]
+    end = time.monotonic() + settings.LIVE_UPDATES["MAX_SECONDS"]
+    try:
+        ranks = await sync_to_async(get_ranks)(event)
+        yield "retry: 3000\n\n"
+        while time.monotonic() < end:
+            message = await subscription.get(timeout=keepalive_seconds)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+
+            # Handle everything that piled up meanwhile in one go.
+            messages = [message]
+            while not subscription.queue.empty():
+                messages.append(subscription.queue.get_nowait())
+
+            game_ids = {message["game_id"] for message in messages}
+            updates = None
+            if None not in game_ids:
+                updates = await sync_to_async(render_game_updates)(
+                    event, username, game_ids, ranks
+                )
+            if updates is None:
+                try:
+                    event = await Event.objects.aget(id=event.id)
+                except Event.DoesNotExist:
+                    return
+                ranks = await sync_to_async(get_ranks)(event)
+                yield _format_sse("event-changed", str(event.uuid))
+                continue
+
+            for name, html in updates:
+                yield _format_sse(name, html)
+    finally:
+        broker.unsubscribe(subscription)
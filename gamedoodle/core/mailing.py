@@ -1,13 +1,18 @@
-from typing import Optional
+from typing import List, Optional
+import logging
 import re
 import smtplib
+import threading
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
 from django.conf import settings
+from django.db import DatabaseError
 
 from gamedoodle.core.models import SentMail
 
+logger = logging.getLogger(__name__)
+
 
 def _replace_url_to_link(value):
     urls = re.compile(
@@ -17,6 +22,146 @@ def _replace_url_to_link(value):
     return urls.sub(r'<a href="\1" target="_blank">\1</a>', value)
 
 
+class GmailMailer:
+    """Send emails over one authenticated connection to the Google Mail SMTP server.
+
+    The connection is opened for the first email and kept open for the
+    following ones, saving a TLS handshake and login per email. If the
+    server closed it in between, it is reopened transparently. Use as
+    context manager to close the connection after a batch:
+
+        with GmailMailer() as mailer:
+            for recipient in recipients:
+                mailer.send(recipient=recipient, subject=..., body=...)
+
+    Credentials are taken from the Django settings.
+
+    """
+
+    def __init__(self):
+        self._server: Optional[smtplib.SMTP] = None
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "GmailMailer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(
+            settings.EMAIL_NOTIFICATIONS["GMAIL_SMTP_SERVER"],
+            settings.EMAIL_NOTIFICATIONS["GMAIL_SMTP_PORT"],
+            timeout=settings.EMAIL_NOTIFICATIONS["GMAIL_SMTP_TIMEOUT_SECONDS"],
+        )
+        try:
+            server.ehlo()
+            if settings.EMAIL_NOTIFICATIONS["GMAIL_USE_TLS"]:
+                server.starttls()
+                server.ehlo()
+            server.login(
+                settings.EMAIL_NOTIFICATIONS["GMAIL_USER"],
+                settings.EMAIL_NOTIFICATIONS["GMAIL_PWD"],  # App-password.
+            )
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except smtplib.SMTPException:
+            self._server.close()
+        except OSError:
+            pass
+        self._server = None
+
+    def _sendmail(self, from_email: str, to_emails: List[str], message: str):
+        with self._lock:
+            if self._server is None:
+                self._server = self._connect()
+            try:
+                self._server.sendmail(from_email, to_emails, message)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # The server may close idle connections, try a new one.
+                self.close()
+                self._server = self._connect()
+                self._server.sendmail(from_email, to_emails, message)
+
+    def send(
+        self,
+        *,
+        recipient: str,
+        subject: str,
+        body: str,
+        html: Optional[str] = None,
+        auto_break: bool = True,
+        auto_links: bool = True,
+        save_to_db: Optional[bool] = True,
+    ):
+        """Send an email, see send_email_via_gmail() for the arguments."""
+        from_email = settings.EMAIL_NOTIFICATIONS["GMAIL_USER"]
+        to_emails = recipient if type(recipient) is list else [recipient]
+
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = subject
+        msg["From"] = from_email
+        msg["To"] = ", ".join(to_emails)
+
+        if html is None:
+            html_body = body
+            if auto_links:
+                html_body = _replace_url_to_link(html_body)
+            if auto_break:
+                html_body = html_body.replace("\n", "<br/>")
+            html = f"""
+            <html>
+            <body style="font-family: sans-serif; margin: 20px">
+                <h1>{subject}</h1>
+                {html_body}
+            </body>
+            </html>
+            """
+
+        # Attach parts into message container.
+        # According to RFC 2046, the last part of a multipart message, in
+        # this case the HTML message, is best and preferred.
+        part1 = MIMEText(body, "plain")
+        part2 = MIMEText(html, "html")
+        msg.attach(part1)
+        msg.attach(part2)
+
+        self._sendmail(from_email, to_emails, msg.as_string())
+
+        if save_to_db:
+            # The email is out already, failing now would only make
+            # callers retry and send it twice.
+            try:
+                SentMail.objects.create(
+                    sender=msg["From"],
+                    recipient=msg["To"],
+                    subject=msg["Subject"],
+                    body=body,
+                    html=html,
+                )
+            except DatabaseError:
+                logger.exception("Could not save email sent to %s", msg["To"])
+
+
+_mailer: Optional[GmailMailer] = None
+
+
+def get_mailer() -> GmailMailer:
+    """Mailer shared by the whole process, keeping its connection open."""
+    global _mailer
+    if _mailer is None:
+        _mailer = GmailMailer()
+    return _mailer
+
+
 def send_email_via_gmail(
     *,
     recipient: str,
@@ -29,7 +174,9 @@ def send_email_via_gmail(
 ):
     """Send email using the Google Mail SMTP server.
 
-    Credentials are taken from the Django settings.
+    Credentials are taken from the Django settings. The connection is
+    shared with other emails sent by this process, use a GmailMailer to
+    send a batch of emails.
 
     Args:
 
@@ -52,56 +199,12 @@ def send_email_via_gmail(
     The email will contain a plain/text and an html version.
 
     """
-    gmail_smtp_server = settings.EMAIL_NOTIFICATIONS["GMAIL_SMTP_SERVER"]
-    gmail_smtp_port = settings.EMAIL_NOTIFICATIONS["GMAIL_SMTP_PORT"]
-    gmail_user = settings.EMAIL_NOTIFICATIONS["GMAIL_USER"]
-    gmail_pwd = settings.EMAIL_NOTIFICATIONS["GMAIL_PWD"]  # App-password.
-
-    from_email = gmail_user
-    to_emails = recipient if type(recipient) is list else [recipient]
-
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = subject
-    msg["From"] = from_email
-    msg["To"] = ", ".join(to_emails)
-
-    if html is None:
-        html_body = body
-        if auto_links:
-            html_body = _replace_url_to_link(html_body)
-        if auto_break:
-            html_body = html_body.replace("\n", "<br/>")
-        html = f"""
-        <html>
-        <body style="font-family: sans-serif; margin: 20px">
-            <h1>{subject}</h1>
-            {html_body}
-        </body>
-        </html>
-        """
-
-    # Attach parts into message container.
-    # According to RFC 2046, the last part of a multipart message, in
-    # this case the HTML message, is best and preferred.
-    part1 = MIMEText(body, "plain")
-    part2 = MIMEText(html, "html")
-    msg.attach(part1)
-    msg.attach(part2)
-
-    server = smtplib.SMTP(gmail_smtp_server, gmail_smtp_port)
-    try:
-        server.ehlo()
-        server.starttls()
-        server.login(gmail_user, gmail_pwd)
-        server.sendmail(from_email, to_emails, msg.as_string())
-
-        if save_to_db:
-            SentMail.objects.create(
-                sender=msg["From"],
-                recipient=msg["To"],
-                subject=msg["Subject"],
-                body=body,
-                html=html,
-            )
-    finally:
-        server.quit()
+    get_mailer().send(
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        html=html,
+        auto_break=auto_break,
+        auto_links=auto_links,
+        save_to_db=save_to_db,
+    )
@@ -0,0 +1,138 @@
+import json
+from datetime import datetime
+from typing import Iterator
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from easyaudit.models import CRUDEvent
+
+from gamedoodle.core.models import ACTIVITIES_STARTED_AT_CHECKPOINT
+from gamedoodle.core.models import Activity
+from gamedoodle.core.models import Checkpoint
+from gamedoodle.core.models import Comment
+from gamedoodle.core.models import Event
+from gamedoodle.core.models import EventGame
+from gamedoodle.core.models import Game
+from gamedoodle.core.models import Vote
+
+
+def iter_vote_activities(before, event_ids, game_ids) -> Iterator[Activity]:
+    """Activities from the audit rows of votes."""
+    crud_events = (
+        CRUDEvent.objects.filter(
+            content_type=ContentType.objects.get_for_model(Vote),
+            datetime__lt=before,
+        )
+        .only("event_type", "object_json_repr", "datetime")
+        .order_by("id")
+    )
+    for crud_event in crud_events.iterator():
+        fields = json.loads(crud_event.object_json_repr)[0]["fields"]
+        if fields["event"] not in event_ids:
+            continue
+        if crud_event.event_type == CRUDEvent.CREATE:
+            kinds = [Activity.VOTE]
+            if fields["is_superlike"]:
+                kinds.append(Activity.SUPERLIKE)
+        elif crud_event.event_type == CRUDEvent.UPDATE:
+            # Only the superlike of a Vote can be changed.
+            kinds = [
+                Activity.SUPERLIKE if fields["is_superlike"] else Activity.UNSUPERLIKE
+            ]
+        elif crud_event.event_type == CRUDEvent.DELETE:
+            kinds = [Activity.UNVOTE]
+        else:
+            continue
+        for kind in kinds:
+            yield Activity(
+                created_at=crud_event.datetime,
+                event_id=fields["event"],
+                kind=kind,
+                actor=fields["username"],
+                game_id=fields["game"] if fields["game"] in game_ids else None,
+                payload={"backfilled": True},
+            )
+
+
+def iter_comment_activities(before) -> Iterator[Activity]:
+    for comment in Comment.objects.filter(created_at__lt=before).order_by("id"):
+        yield Activity(
+            created_at=comment.created_at,
+            event_id=comment.event_id,
+            kind=Activity.COMMENT,
+            actor=comment.username,
+            game_id=comment.game_id,
+            payload={
+                "comment_id": comment.id,
+                "preview": comment.short_preview,
+                "backfilled": True,
+            },
+        )
+
+
+def iter_add_game_activities(before) -> Iterator[Activity]:
+    for event_game in EventGame.objects.filter(created_at__lt=before).order_by("id"):
+        yield Activity(
+            created_at=event_game.created_at,
+            event_id=event_game.event_id,
+            kind=Activity.ADD_GAME,
+            actor=event_game.added_by_username,
+            game_id=event_game.game_id,
+            payload={"backfilled": True},
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Create Activity rows from audit rows, comments and event games "
+        "from before Activity was logged"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of activities to write to the database at once",
+        )
+        parser.add_argument(
+            "--before",
+            default=None,
+            help="Backfill changes before this ISO 8601 time instead of the "
+            "time stored when the Activity table was created",
+        )
+
+    def handle(self, *args, **options):
+        # Everything since has been logged already, see migration 0020.
+        # Previously backfilled ones are replaced, to allow running again.
+        started_at = options["before"] or Checkpoint.get_value(
+            ACTIVITIES_STARTED_AT_CHECKPOINT
+        )
+        if not started_at:
+            raise CommandError(
+                f"Checkpoint {ACTIVITIES_STARTED_AT_CHECKPOINT} is missing, pass "
+                "--before with the time when Activity started to be logged"
+            )
+        before = datetime.fromisoformat(started_at)
+
+        event_ids = set(Event.objects.values_list("id", flat=True))
+        game_ids = set(Game.objects.values_list("id", flat=True))
+        num_created = 0
+        with transaction.atomic():
+            Activity.objects.filter(payload__has_key="backfilled").delete()
+            for activities in (
+                iter_vote_activities(before, event_ids, game_ids),
+                iter_comment_activities(before),
+                iter_add_game_activities(before),
+            ):
+                batch = []
+                for activity in activities:
+                    batch.append(activity)
+                    if len(batch) == options["batch_size"]:
+                        num_created += len(Activity.objects.bulk_create(batch))
+                        batch = []
+                num_created += len(Activity.objects.bulk_create(batch))
+
+        print(f"Created {num_created} activities from before {before}")
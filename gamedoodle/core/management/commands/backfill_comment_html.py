@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from gamedoodle.core.models import Comment
+from gamedoodle.core.models import render_comment_html
+
+
+class Command(BaseCommand):
+    help = "Render and store the HTML of comments from before it was stored"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of comments to write to the database at once",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Render all comments again, e.g. after changing the rendering",
+        )
+
+    def handle(self, *args, **options):
+        comments = Comment.objects.only("id", "text").order_by("id")
+        if not options["all"]:
+            comments = comments.filter(text_html="")
+
+        num_updated = 0
+        last_id = 0
+        while True:
+            batch = list(comments.filter(id__gt=last_id)[: options["batch_size"]])
+            if not batch:
+                break
+            for comment in batch:
+                comment.text_html = render_comment_html(comment.text)
+            # Bypass Comment.save() and its signals, nothing visible changes.
+            num_updated += Comment.objects.bulk_update(batch, ["text_html"])
+            last_id = batch[-1].id
+
+        print(f"Rendered {num_updated} comments")
@@ -0,0 +1,96 @@
+import time
+from datetime import timedelta
+from functools import partial
+
+import bleach
+from bleach import Cleaner
+from bleach.linkifier import LinkifyFilter
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from gamedoodle.core.comments import CommentPage
+from gamedoodle.core.models import Comment
+from gamedoodle.core.models import Event
+from gamedoodle.core.models import augment_comment_alignment
+from gamedoodle.core.models import render_comment_html
+
+
+def _render_with_new_cleaner(text: str) -> str:
+    # What Comment.text_as_html did before the HTML was stored.
+    def break_word(attrs, new=False):
+        attrs[(None, "style")] = "word-break: break-word"
+        return attrs
+
+    callbacks = bleach.linkifier.DEFAULT_CALLBACKS + [break_word]
+    filters = [partial(LinkifyFilter, callbacks=callbacks)]
+    return Cleaner(filters=filters).clean(text)
+
+
+def _render_thread(event, comments) -> float:
+    start = time.perf_counter()
+    render_to_string(
+        "core/event_add_comment_content.html",
+        {
+            "event": event,
+            "game": None,
+            "comment_page": CommentPage(comments=comments),
+            "username": "Bob",
+            "csrf_token": "benchmark",
+        },
+    )
+    return time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare render times of a comment thread with a new bleach Cleaner "
+        "per comment, the shared Cleaner and stored HTML"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--comments", type=int, default=1000)
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Report the best of this many"
+        )
+
+    def handle(self, *args, **options):
+        # Nothing is saved, the comments only live in memory.
+        event = Event(name="Benchmark")
+        created_at = timezone.now() - timedelta(days=1)
+        comments = augment_comment_alignment(
+            [
+                Comment(
+                    event=event,
+                    username=f"User{i % 3}",
+                    text=f"Comment {i}: see https://example.com/games/{i} "
+                    f"and <b>this</b> & <script>that</script>",
+                    created_at=created_at,
+                )
+                for i in range(options["comments"])
+            ]
+        )
+
+        def before():
+            start = time.perf_counter()
+            for comment in comments:
+                comment.text_html = _render_with_new_cleaner(comment.text)
+            return time.perf_counter() - start + _render_thread(event, comments)
+
+        def shared_cleaner():
+            for comment in comments:
+                comment.text_html = ""
+            return _render_thread(event, comments)
+
+        def stored():
+            for comment in comments:
+                comment.text_html = render_comment_html(comment.text)
+            return _render_thread(event, comments)
+
+        for label, run in [
+            ("new cleaner per comment", before),
+            ("shared cleaner", shared_cleaner),
+            ("stored html", stored),
+        ]:
+            seconds = min(run() for _ in range(options["repeat"]))
+            print(f"{label}: {seconds * 1000:.1f} ms")
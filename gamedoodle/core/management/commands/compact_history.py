@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from gamedoodle.core.retention import compact
+from gamedoodle.core.retention import count_expired
+from gamedoodle.core.retention import get_archive_path
+from gamedoodle.core.retention import get_policies
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive and delete old SentMail and audit rows according to "
+        "settings.RETENTION"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.RETENTION["BATCH_SIZE"],
+            help="Number of rows to delete per transaction",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.1,
+            help="Seconds to wait between batches, to let other writers in",
+        )
+        parser.add_argument(
+            "--no-archive",
+            action="store_true",
+            help="Delete expired rows without archiving them first",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only print how many rows would be deleted",
+        )
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            for name, num_expired in count_expired().items():
+                print(f"{name}: {num_expired} rows would be deleted")
+            return
+
+        for policy in get_policies():
+            num_deleted = compact(
+                policy,
+                batch_size=options["batch_size"],
+                archive=not options["no_archive"],
+                pause_seconds=options["pause"],
+            )
+            archived = "" if options["no_archive"] else f" into {get_archive_path(policy)}"
+            print(f"{policy.name}: deleted {num_deleted} rows{archived}")
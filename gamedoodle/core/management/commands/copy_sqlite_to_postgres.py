@@ -0,0 +1,145 @@
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from typing import Iterator
+from typing import List
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
+from django.db import connection
+from django.db import transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.utils import timezone
+
+
+def get_models_to_copy() -> List[type]:
+    return [
+        model
+        for model in apps.get_models(include_auto_created=True)
+        if model._meta.managed and not model._meta.proxy
+    ]
+
+
+def iter_row_batches(
+    source: sqlite3.Connection, model, batch_size: int
+) -> Iterator[List[dict]]:
+    """Yield rows of the model's table, ordered by primary key."""
+    table = model._meta.db_table
+    pk_column = model._meta.pk.column
+    last_pk = None
+    while True:
+        if last_pk is None:
+            cursor = source.execute(
+                f'SELECT * FROM "{table}" ORDER BY "{pk_column}" LIMIT ?',
+                (batch_size,),
+            )
+        else:
+            cursor = source.execute(
+                f'SELECT * FROM "{table}" WHERE "{pk_column}" > ? '
+                f'ORDER BY "{pk_column}" LIMIT ?',
+                (last_pk, batch_size),
+            )
+        columns = [description[0] for description in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1][pk_column]
+
+
+def to_instance(model, row: dict):
+    """Model instance from a raw SQLite row."""
+    values = {}
+    for field in model._meta.concrete_fields:
+        value = row[field.column]
+        if value is not None and hasattr(field, "from_db_value"):
+            value = field.from_db_value(value, None, connection)
+        value = field.to_python(value)
+        if isinstance(value, datetime) and timezone.is_naive(value):
+            # Django stores datetimes in SQLite as naive UTC.
+            value = timezone.make_aware(value, dt_timezone.utc)
+        values[field.attname] = value
+    return model(**values)
+
+
+@contextmanager
+def keep_timestamps(model):
+    """Do not overwrite auto_now(_add) fields with the current time."""
+    fields = [
+        field
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy all data from a SQLite database into the configured (empty, "
+        "migrated) PostgreSQL database in batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("sqlite_path", help="Path to db.sqlite3")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Number of rows to read and write at once",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Set DATABASE_ENGINE=postgresql to copy into")
+
+        source = sqlite3.connect(f"file:{options['sqlite_path']}?mode=ro", uri=True)
+        source_migrations = set(
+            source.execute("SELECT app, name FROM django_migrations").fetchall()
+        )
+        target_migrations = set(MigrationRecorder(connection).applied_migrations())
+        if source_migrations != target_migrations:
+            raise CommandError(
+                "Both databases must be migrated to the same state, run "
+                "migrate on the SQLite database first"
+            )
+
+        models = get_models_to_copy()
+        # Foreign keys are only checked at the end of the transaction.
+        with transaction.atomic():
+            # Replace e.g. content types created by migrate.
+            tables = [model._meta.db_table for model in models]
+            for sql in connection.ops.sql_flush(
+                no_style(), tables, allow_cascade=True
+            ):
+                connection.cursor().execute(sql)
+
+            for model in models:
+                num_copied = 0
+                with keep_timestamps(model):
+                    for rows in iter_row_batches(
+                        source, model, options["batch_size"]
+                    ):
+                        # Not through custom default managers, which may
+                        # filter or change what they create.
+                        model._base_manager.bulk_create(
+                            [to_instance(model, row) for row in rows]
+                        )
+                        num_copied += len(rows)
+                print(f"Copied {num_copied} rows of {model._meta.label}")
+
+            # Continue ids after the copied rows.
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                connection.cursor().execute(sql)
+
+        source.close()
+        print("Done")
@@ -1,36 +1,118 @@
+import time
+from typing import Iterator
 from typing import List
+from typing import Tuple
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 
 import requests
+from gamedoodle.core.models import Checkpoint
 from gamedoodle.core.models import Game
+from gamedoodle.core.search import index_games
+from gamedoodle.core.steam import get_session
 
+CHECKPOINT_NAME = "fetch_all_steam_games.last_appid"
 
-class Command(BaseCommand):
-    def handle(self, *args, **options):
-        apps: List[dict] = []
-        url: str = settings.STEAM_API_URL_GET_APP_LIST
 
-        data: dict = requests.get(url).json()
-        last_appid: int = data["response"].get("last_appid", -1)
-        apps += data["response"]["apps"]
+def iter_app_list_pages(
+    session: requests.Session, last_appid: int
+) -> Iterator[Tuple[List[dict], int]]:
+    """Yield (apps, last_appid) for each page of the Steam app list."""
+    while True:
+        url = settings.STEAM_API_URL_GET_APP_LIST
+        if last_appid:
+            url += f"&last_appid={last_appid}"
+        response = session.get(url, timeout=60)
+        response.raise_for_status()
+        data: dict = response.json()["response"]
 
-        while data["response"].get("have_more_results", False) and last_appid:
-            url = settings.STEAM_API_URL_GET_APP_LIST + f"&last_appid={last_appid}"
-            data =  requests.get(url).json()
-            last_appid = data["response"].get("last_appid", -1)
-            apps += data["response"]["apps"]
+        apps = data.get("apps", [])
+        last_appid = data.get("last_appid", apps[-1]["appid"] if apps else 0)
+        yield apps, last_appid
 
-        app_id_to_name = {app["appid"]: app["name"].strip() for app in apps}
+        if not data.get("have_more_results", False) or not last_appid:
+            return
 
-        fetched_app_ids = [app["appid"] for app in apps]
-        existing_app_ids = Game.objects.all().values_list("appid", flat=True)
-        new_app_ids = set(fetched_app_ids) - set(existing_app_ids)
 
-        games = [
-            Game(appid=app_id, name=app_id_to_name[app_id]) for app_id in new_app_ids
+def upsert_games(apps: List[dict], batch_size: int) -> int:
+    """Create Games for apps or rename existing ones, return number of apps."""
+    for start in range(0, len(apps), batch_size):
+        # Only the last name counts if an appid is listed more than once.
+        batch = {
+            app["appid"]: app["name"].strip()
+            for app in apps[start : start + batch_size]
+        }
+        # Leave unchanged Games alone, so their modified_at stays.
+        names = dict(
+            Game.objects.filter(appid__in=batch.keys()).values_list("appid", "name")
+        )
+        now = timezone.now()
+        changed_games = [
+            Game(appid=appid, name=name, modified_at=now)
+            for appid, name in batch.items()
+            if names.get(appid) != name
         ]
-        print(f"Fetched {len(games)} new games...")
-        Game.objects.bulk_create(games)
-        print("Done")
+        if not changed_games:
+            continue
+        Game.objects.bulk_create(
+            changed_games,
+            update_conflicts=True,
+            unique_fields=["appid"],
+            update_fields=["name", "modified_at"],
+        )
+        index_games(
+            Game.objects.filter(
+                appid__in=[game.appid for game in changed_games]
+            ).only("id", "name")
+        )
+    return len(apps)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import all apps from the Steam app list page by page. Continues "
+        "after the last imported page if a previous run did not finish."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of games to write to the database at once",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore the checkpoint of an unfinished run",
+        )
+
+    def handle(self, *args, **options):
+        last_appid = 0
+        if not options["restart"]:
+            last_appid = int(Checkpoint.get_value(CHECKPOINT_NAME, "0"))
+        if last_appid:
+            print(f"Continuing after appid {last_appid}...")
+
+        started_at = time.monotonic()
+        num_imported = 0
+        for apps, last_appid in iter_app_list_pages(get_session(), last_appid):
+            page_started_at = time.monotonic()
+            num_imported += upsert_games(apps, options["batch_size"])
+            Checkpoint.set_value(CHECKPOINT_NAME, str(last_appid))
+
+            page_seconds = time.monotonic() - page_started_at
+            print(
+                f"Imported {len(apps)} games up to appid {last_appid} "
+                f"({len(apps) / max(page_seconds, 0.001):.0f} games/s)"
+            )
+
+        Checkpoint.objects.filter(name=CHECKPOINT_NAME).delete()
+
+        seconds = time.monotonic() - started_at
+        print(
+            f"Done, imported {num_imported} games in {seconds:.1f}s "
+            f"({num_imported / max(seconds, 0.001):.0f} games/s)"
+        )
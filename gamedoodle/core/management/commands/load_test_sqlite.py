@@ -0,0 +1,118 @@
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# What Python's sqlite3 and thus Django use without SQLITE_PRAGMAS.
+DEFAULT_PRAGMAS = {"journal_mode": "delete", "synchronous": "full"}
+
+
+def _connect(path: Path, pragmas: Dict[str, object]) -> sqlite3.Connection:
+    # Autocommit like Django, each statement is its own transaction.
+    connection = sqlite3.connect(path, isolation_level=None)
+    for name, value in pragmas.items():
+        connection.execute(f"PRAGMA {name} = {value}")
+    return connection
+
+
+def run_load(
+    path: Path, pragmas: Dict[str, object], writers: int, readers: int, seconds: float
+) -> Dict[str, float]:
+    """Vote and read the scoreboard from several threads, return rates."""
+    connection = _connect(path, pragmas)
+    connection.execute(
+        "CREATE TABLE vote ("
+        "id INTEGER PRIMARY KEY, event_id INTEGER, game_id INTEGER, "
+        "username TEXT, is_superlike BOOL, UNIQUE (event_id, game_id, username))"
+    )
+    connection.close()
+
+    counts = {"votes": 0, "reads": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def count(name):
+        with lock:
+            counts[name] += 1
+
+    def write(writer: int):
+        connection = _connect(path, pragmas)
+        i = 0
+        while time.monotonic() < deadline:
+            i += 1
+            try:
+                connection.execute(
+                    "INSERT INTO vote (event_id, game_id, username, is_superlike) "
+                    "VALUES (1, ?, ?, 0)",
+                    (i % 50, f"User{writer}-{i}"),
+                )
+                count("votes")
+            except sqlite3.OperationalError:
+                count("locked")
+        connection.close()
+
+    def read():
+        connection = _connect(path, pragmas)
+        while time.monotonic() < deadline:
+            try:
+                connection.execute(
+                    "SELECT game_id, COUNT(*) FROM vote WHERE event_id = 1 "
+                    "GROUP BY game_id"
+                ).fetchall()
+                count("reads")
+            except sqlite3.OperationalError:
+                count("locked")
+        connection.close()
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=read) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {name: value / seconds for name, value in counts.items()}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare vote throughput of concurrent writers on a scratch SQLite "
+        "database with default settings and with settings.SQLITE_PRAGMAS"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8)
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument(
+            "--seconds", type=float, default=5, help="Duration of each run"
+        )
+        parser.add_argument(
+            "--dir",
+            default=None,
+            help="Where to create the scratch databases, use the disk of the "
+            "production database for realistic numbers",
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory(dir=options["dir"]) as tmp_dir:
+            for label, pragmas in [
+                ("default", DEFAULT_PRAGMAS),
+                ("tuned", settings.SQLITE_PRAGMAS),
+            ]:
+                rates = run_load(
+                    Path(tmp_dir) / f"{label}.sqlite3",
+                    pragmas,
+                    writers=options["writers"],
+                    readers=options["readers"],
+                    seconds=options["seconds"],
+                )
+                print(
+                    f"{label}: {rates['votes']:.0f} votes/s, "
+                    f"{rates['reads']:.0f} reads/s, "
+                    f"{rates['locked']:.0f} locked errors/s"
+                )
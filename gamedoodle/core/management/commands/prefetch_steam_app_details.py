@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+
+import requests
+from django.core.management.base import BaseCommand
+
+from gamedoodle.core.models import Game
+from gamedoodle.core.steam import apply_app_details
+from gamedoodle.core.steam import get_fresh_app_details
+from gamedoodle.core.steam import request_app_details
+from gamedoodle.core.steam import store_app_details
+
+
+class Command(BaseCommand):
+    help = "Fetch Steam details of all games on writable events into the cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of requests to Steam at the same time",
+        )
+
+    def handle(self, *args, **options):
+        games = Game.objects.filter(
+            eventgame__event__read_only=False, appid__isnull=False
+        ).distinct()
+        cached_appids = set(
+            get_fresh_app_details()
+            .filter(appid__in=games.values("appid"))
+            .values_list("appid", flat=True)
+        )
+        games = [game for game in games if game.appid not in cached_appids]
+        print(f"Fetching details of {len(games)} games...")
+
+        num_failed = 0
+        # Only the requests run in threads, the database is written to
+        # from here, so the threads do not need connections of their own.
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            futures = {
+                executor.submit(request_app_details, game.appid): game
+                for game in games
+            }
+            for future in as_completed(futures):
+                game = futures[future]
+                try:
+                    data = future.result()
+                except requests.RequestException as error:
+                    num_failed += 1
+                    print(f"Failed to fetch {game}: {error}")
+                    continue
+                store_app_details(game.appid, data)
+                apply_app_details(game, data)
+                game.save()
+
+        print(f"Done, {len(games) - num_failed} fetched, {num_failed} failed")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from gamedoodle.core.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the search index for Game names from all Games"
+
+    def handle(self, *args, **options):
+        num_games = rebuild_index()
+        print(f"Indexed {num_games} games")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from gamedoodle.core.counters import recount_event
+from gamedoodle.core.models import Event
+
+
+class Command(BaseCommand):
+    help = (
+        "Count votes, participants and comments of events again and fix "
+        "the stored counters where they are off"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "uuids", nargs="*", help="Only recount these events, defaults to all"
+        )
+
+    def handle(self, *args, **options):
+        events = Event.objects.order_by("id")
+        if options["uuids"]:
+            events = events.filter(uuid__in=options["uuids"])
+
+        num_events = 0
+        num_fixed = 0
+        for event_id in events.values_list("id", flat=True).iterator():
+            num_events += 1
+            if recount_event(event_id):
+                num_fixed += 1
+
+        print(f"Recounted {num_events} events, fixed {num_fixed}")
@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from gamedoodle.core import tasks  # noqa: F401, registers the tasks
+from gamedoodle.core.jobs import claim_next_job
+from gamedoodle.core.jobs import requeue_stale_jobs
+from gamedoodle.core.jobs import run_job
+from gamedoodle.core.mailing import get_mailer
+
+
+def _work(once: bool, poll_seconds: float):
+    while True:
+        job = claim_next_job()
+        if job is not None:
+            run_job(job)
+        elif once:
+            return
+        else:
+            time.sleep(poll_seconds)
+
+
+def _work_in_thread(once: bool, poll_seconds: float):
+    try:
+        _work(once, poll_seconds)
+    finally:
+        # Each thread has a database connection of its own.
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.JOB_QUEUE["CONCURRENCY"],
+            help="Number of jobs to run at the same time",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Stop when there are no more due jobs instead of waiting",
+        )
+
+    def handle(self, *args, **options):
+        num_requeued = requeue_stale_jobs()
+        if num_requeued:
+            print(f"Requeued {num_requeued} stale jobs")
+
+        poll_seconds = settings.JOB_QUEUE["POLL_SECONDS"]
+        concurrency = options["concurrency"]
+        try:
+            if concurrency == 1:
+                _work(options["once"], poll_seconds)
+                return
+
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [
+                    executor.submit(_work_in_thread, options["once"], poll_seconds)
+                    for _ in range(concurrency)
+                ]
+                for future in futures:
+                    future.result()
+        finally:
+            # Emails of all jobs are sent over one connection, see send_email.
+            get_mailer().close()
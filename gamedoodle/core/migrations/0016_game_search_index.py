@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE core_game_search "
+            "USING fts5(name, tokenize='trigram')"
+        )
+        schema_editor.execute(
+            "INSERT INTO core_game_search(rowid, name) SELECT id, name FROM core_game"
+        )
+    elif connection.vendor == "postgresql":
+        # Matches the UPPER(...) LIKE UPPER(...) used for icontains lookups.
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX core_game_name_trgm "
+            "ON core_game USING gin (UPPER(name) gin_trgm_ops)"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS core_game_search")
+    elif connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS core_game_name_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_alter_comment_game'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2 on 2026-10-18 15:14
+
+from django.db import migrations, models
+
+
+def merge_duplicate_appids(apps, schema_editor):
+    # Keep the first Game of each appid and move what refers to the
+    # others over to it, unless that would be a duplicate itself.
+    Game = apps.get_model("core", "Game")
+    EventGame = apps.get_model("core", "EventGame")
+    Vote = apps.get_model("core", "Vote")
+    Comment = apps.get_model("core", "Comment")
+
+    duplicate_appids = (
+        Game.objects.filter(appid__isnull=False)
+        .values("appid")
+        .annotate(count=models.Count("id"))
+        .filter(count__gt=1)
+        .values_list("appid", flat=True)
+    )
+    removed_game_ids = []
+    for appid in duplicate_appids:
+        game_id, *duplicate_ids = (
+            Game.objects.filter(appid=appid).order_by("id").values_list("id", flat=True)
+        )
+        for event_game in EventGame.objects.filter(game_id__in=duplicate_ids):
+            if EventGame.objects.filter(
+                event_id=event_game.event_id, game_id=game_id
+            ).exists():
+                event_game.delete()
+            else:
+                EventGame.objects.filter(id=event_game.id).update(game_id=game_id)
+        for vote in Vote.objects.filter(game_id__in=duplicate_ids):
+            if Vote.objects.filter(
+                event_id=vote.event_id, game_id=game_id, username=vote.username
+            ).exists():
+                vote.delete()
+            else:
+                Vote.objects.filter(id=vote.id).update(game_id=game_id)
+        Comment.objects.filter(game_id__in=duplicate_ids).update(game_id=game_id)
+        Game.objects.filter(id__in=duplicate_ids).delete()
+        removed_game_ids.extend(duplicate_ids)
+
+    # See migration 0016.
+    if removed_game_ids and schema_editor.connection.vendor == "sqlite":
+        placeholders = ", ".join(["%s"] * len(removed_game_ids))
+        schema_editor.execute(
+            f"DELETE FROM core_game_search WHERE rowid IN ({placeholders})",
+            removed_game_ids,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_game_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Checkpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=256, unique=True)),
+                ('value', models.CharField(blank=True, default='', max_length=256)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(merge_duplicate_appids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='game',
+            constraint=models.UniqueConstraint(fields=('appid',), name='unique appid'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2 on 2026-10-18 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_steam_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SteamAppDetails',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('appid', models.PositiveIntegerField(unique=True)),
+                ('data', models.JSONField(blank=True, default=None, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
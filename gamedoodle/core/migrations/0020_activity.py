@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-18 15:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def remember_start_of_activities(apps, schema_editor):
+    # Anything older is added by the backfill_activities command.
+    Checkpoint = apps.get_model("core", "Checkpoint")
+    Checkpoint.objects.update_or_create(
+        name="activities.started_at",
+        defaults={"value": django.utils.timezone.now().isoformat()},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Activity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('kind', models.CharField(choices=[('vote', 'Vote'), ('unvote', 'Unvote'), ('superlike', 'Superlike'), ('unsuperlike', 'Unsuperlike'), ('comment', 'Comment'), ('add_game', 'Add game')], max_length=16)),
+                ('actor', models.CharField(blank=True, default='', max_length=256)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.event')),
+                ('game', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.game')),
+            ],
+            options={
+                'verbose_name_plural': 'activities',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['event', 'created_at'], name='core_activi_event_i_08df84_idx'),
+        ),
+        migrations.RunPython(remember_start_of_activities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-18 15:26
+
+from django.db import migrations, models
+import uuid
+
+
+def delete_duplicate_event_games(apps, schema_editor):
+    # Keep the first one, which knows who added the Game.
+    EventGame = apps.get_model("core", "EventGame")
+    first_ids = (
+        EventGame.objects.values("event_id", "game_id")
+        .annotate(first_id=models.Min("id"))
+        .values("first_id")
+    )
+    EventGame.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_activity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='eventsubscription',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('softdeleted', False)), fields=['event', 'created_at'], name='comment_event_visible_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('softdeleted', False)), fields=['event', 'game', 'created_at'], name='comment_game_visible_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['event', 'username'], name='vote_event_username_idx'),
+        ),
+        migrations.RunPython(delete_duplicate_event_games, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='eventgame',
+            constraint=models.UniqueConstraint(fields=('event', 'game'), name='unique event game'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+
+def remove_duplicate_superlikes(apps, schema_editor):
+    # Keep the first superlike, concurrent clicks may have added more.
+    Vote = apps.get_model("core", "Vote")
+    first_ids = (
+        Vote.objects.filter(is_superlike=True)
+        .values("event_id", "username")
+        .annotate(first_id=models.Min("id"))
+        .values("first_id")
+    )
+    Vote.objects.filter(is_superlike=True).exclude(id__in=first_ids).update(
+        is_superlike=False
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_event_detail_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_superlikes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_superlike', True)), fields=('event', 'username'), name='unique superlike'),
+        ),
+    ]
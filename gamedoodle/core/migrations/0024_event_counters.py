@@ -0,0 +1,81 @@
+# Generated by Django 4.2 on 2026-10-18 15:37
+
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_existing(apps, schema_editor):
+    Event = apps.get_model("core", "Event")
+    EventParticipant = apps.get_model("core", "EventParticipant")
+    Vote = apps.get_model("core", "Vote")
+    Comment = apps.get_model("core", "Comment")
+
+    participants = [
+        EventParticipant(event_id=event_id, username=username, num_votes=num_votes)
+        for event_id, username, num_votes in Vote.objects.values("event_id", "username")
+        .annotate(num_votes=models.Count("id"))
+        .values_list("event_id", "username", "num_votes")
+    ]
+    EventParticipant.objects.bulk_create(participants, batch_size=1000)
+
+    num_comments_by_event_id = dict(
+        Comment.objects.filter(game__isnull=True, softdeleted=False)
+        .values("event_id")
+        .annotate(count=models.Count("id"))
+        .values_list("event_id", "count")
+    )
+    num_votes_by_event_id = defaultdict(int)
+    num_participants_by_event_id = defaultdict(int)
+    for participant in participants:
+        num_votes_by_event_id[participant.event_id] += participant.num_votes
+        num_participants_by_event_id[participant.event_id] += 1
+
+    events = list(Event.objects.all())
+    for event in events:
+        event.num_votes = num_votes_by_event_id[event.id]
+        event.num_participants = num_participants_by_event_id[event.id]
+        event.num_comments = num_comments_by_event_id.get(event.id, 0)
+    Event.objects.bulk_update(
+        events, ["num_votes", "num_participants", "num_comments"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_comment_text_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='num_comments',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='num_participants',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='num_votes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='EventParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=256)),
+                ('num_votes', models.PositiveIntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.event')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='eventparticipant',
+            constraint=models.UniqueConstraint(fields=('event', 'username'), name='unique event participant'),
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
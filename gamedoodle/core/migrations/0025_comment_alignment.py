@@ -0,0 +1,51 @@
+# Generated by Django 4.2 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+def align_existing_comments(apps, schema_editor):
+    # Like gamedoodle.core.models.augment_comment_alignment, in one pass
+    # over all threads.
+    Comment = apps.get_model("core", "Comment")
+    comments = (
+        Comment.objects.filter(softdeleted=False)
+        .only("event_id", "game_id", "username")
+        .order_by("event_id", "game_id", "created_at", "id")
+    )
+    previous_comment = None
+    batch = []
+    for comment in comments.iterator():
+        if previous_comment is None or (
+            (previous_comment.event_id, previous_comment.game_id)
+            != (comment.event_id, comment.game_id)
+        ):
+            comment.alignment = "left"
+        elif previous_comment.username == comment.username:
+            comment.alignment = previous_comment.alignment
+        elif previous_comment.alignment == "left":
+            comment.alignment = "right"
+        else:
+            comment.alignment = "left"
+        previous_comment = comment
+        if comment.alignment != "left":
+            batch.append(comment)
+        if len(batch) == 1000:
+            Comment.objects.bulk_update(batch, ["alignment"])
+            batch = []
+    Comment.objects.bulk_update(batch, ["alignment"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_event_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='alignment',
+            field=models.CharField(default='left', editable=False, max_length=8),
+        ),
+        migrations.RunPython(align_existing_comments, migrations.RunPython.noop),
+    ]
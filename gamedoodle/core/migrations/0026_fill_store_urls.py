@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-18 16:05
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import CharField
+from django.db.models import Value
+from django.db.models.functions import Cast
+from django.db.models.functions import Concat
+
+
+def fill_store_urls(apps, schema_editor):
+    # Like gamedoodle.core.steam.get_store_url, for Games that never got
+    # their details fetched.
+    Game = apps.get_model("core", "Game")
+    Game.objects.filter(appid__isnull=False, store_url="").update(
+        store_url=Concat(
+            Value(settings.STEAM_STORE_PAGE_BASE_URL),
+            Cast("appid", output_field=CharField()),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0025_comment_alignment"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_store_urls, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+import threading
 import uuid
 from datetime import timedelta, date
 from functools import partial
@@ -10,10 +11,57 @@ from bleach.linkifier import LinkifyFilter
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import FloatField
+from django.db.models import Q
+from django.db.models import Subquery
+from django.db.models import Value
+from django.db.models import Window
+from django.db.models.functions import Cast
+from django.db.models.functions import Coalesce
+from django.db.models.functions import DenseRank
+from django.db.models.functions import Lower
+from django.db.models.functions import NullIf
 from django.utils import timezone
 
 COMMENT_IS_NEW_THRESHOLD_MINUTES = 60
 
+# When Activity started to be logged, see the backfill_activities command.
+ACTIVITIES_STARTED_AT_CHECKPOINT = "activities.started_at"
+
+
+def _break_word(attrs, new=False):
+    attrs[(None, "style")] = "word-break: break-word"
+    return attrs
+
+
+# Building a Cleaner is expensive, so there is only one, but it is not
+# thread-safe.
+_comment_cleaner = Cleaner(
+    filters=[
+        partial(
+            LinkifyFilter,
+            callbacks=bleach.linkifier.DEFAULT_CALLBACKS + [_break_word],
+        )
+    ]
+)
+_comment_cleaner_lock = threading.Lock()
+
+
+def render_comment_html(text: str) -> str:
+    """Clean, linkify and prevent link overflow.
+
+    See:
+
+    - https://bleach.readthedocs.io/en/latest/linkify.html#linkify-linkifyfilter
+    - https://github.com/mozilla/bleach/blob/24c21bb8a20d0c72a44fee81c290f41774e8384e/bleach/callbacks.py
+
+    """
+    with _comment_cleaner_lock:
+        return _comment_cleaner.clean(text)
+
 
 class TimestampedMixin(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -26,7 +74,7 @@ class TimestampedMixin(models.Model):
 class Event(TimestampedMixin, models.Model):
     """A date on which to play certain games that can be voted for."""
 
-    uuid = models.UUIDField(default=uuid.uuid4, editable=False)
+    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     name = models.CharField(max_length=256)
     details = models.TextField(default="", blank=True)
     date = models.DateField(default=date.today, blank=True, null=True)
@@ -36,6 +84,13 @@ class Event(TimestampedMixin, models.Model):
     read_only = models.BooleanField(default=False)
     listed = models.BooleanField(default=True)
 
+    # Maintained by gamedoodle.core.counters on every Vote and Comment.
+    num_votes = models.PositiveIntegerField(default=0, editable=False)
+    num_participants = models.PositiveIntegerField(default=0, editable=False)
+    """Distinct usernames that have voted, see EventParticipant."""
+    num_comments = models.PositiveIntegerField(default=0, editable=False)
+    """Visible general comments, those about a Game do not count."""
+
     def __str__(self):
         date_str = "no date yet"
         if self.date:
@@ -48,24 +103,41 @@ class Event(TimestampedMixin, models.Model):
 
     @property
     def usernames(self):
-        return sorted(
-            [
-                username
-                for username in (
-                    self.vote_set.all()
-                    .values_list("username", flat=True)
-                    .distinct()
-                )
-            ],
-            key=lambda username: username.lower()
+        return list(
+            self.eventparticipant_set.order_by(Lower("username")).values_list(
+                "username", flat=True
+            )
         )
 
 
+class EventParticipant(models.Model):
+    """Someone who has voted for Games of an Event, and how often."""
+
+    event = models.ForeignKey("Event", on_delete=models.CASCADE)
+    username = models.CharField(max_length=256)
+    num_votes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "username"], name="unique event participant"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.username} voted {self.num_votes}x during '{self.event}'"
+
+
 class EventGame(TimestampedMixin, models.Model):
     event = models.ForeignKey("Event", on_delete=models.CASCADE)
     game = models.ForeignKey("Game", on_delete=models.CASCADE)
     added_by_username = models.CharField(max_length=256, default="", blank=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["event", "game"], name="unique event game")
+        ]
+
 
 class EventSubscription(TimestampedMixin, models.Model):
     """A User wants to receive activity notifications about an Event."""
@@ -74,7 +146,7 @@ class EventSubscription(TimestampedMixin, models.Model):
     email = models.EmailField(max_length=254)
     username = models.CharField(max_length=256, default="", blank=True)
     active = models.BooleanField(default=False)
-    uuid = models.UUIDField(default=uuid.uuid4, editable=False)
+    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
 
     def __str__(self):
         return (
@@ -83,6 +155,51 @@ class EventSubscription(TimestampedMixin, models.Model):
         )
 
 
+class GameQuerySet(models.QuerySet):
+    def with_event_score(self, event: Event) -> "GameQuerySet":
+        """Games of given Event, annotated with their score and ordered by it.
+
+        Annotations:
+
+        - num_votes (int)
+        - num_superlikes (int)
+        - num_event_participants (int): Event.num_participants.
+        - votes_value (float): num_votes plus a fraction of
+          1 / num_event_participants for each superlike.
+        - voting_rank (int): Dense rank by votes_value, starting at 1.
+        - added_by_username (str)
+
+        """
+        # Read the counter in the query, the instance may be outdated.
+        num_event_participants = Subquery(
+            Event.objects.filter(id=event.id).values("num_participants")
+        )
+        num_votes = Count("vote", filter=Q(vote__event=event))
+        num_superlikes = Count(
+            "vote", filter=Q(vote__event=event, vote__is_superlike=True)
+        )
+        superlike_bonus = Coalesce(
+            Cast(num_superlikes, FloatField())
+            / NullIf(Cast(num_event_participants, FloatField()), Value(0.0)),
+            Value(0.0),
+        )
+        votes_value = Cast(num_votes, FloatField()) + superlike_bonus
+        return (
+            self.filter(eventgame__event=event)
+            .annotate(
+                added_by_username=F("eventgame__added_by_username"),
+                num_votes=num_votes,
+                num_superlikes=num_superlikes,
+                num_event_participants=Coalesce(num_event_participants, 0),
+                votes_value=votes_value,
+                voting_rank=Window(
+                    DenseRank(), order_by=F("votes_value").desc()
+                ),
+            )
+            .order_by("-votes_value", Lower("name"))
+        )
+
+
 class Game(TimestampedMixin, models.Model):
     """A Game on Steam."""
 
@@ -92,17 +209,26 @@ class Game(TimestampedMixin, models.Model):
     store_url = models.CharField(max_length=256, blank=True, default="")
     is_free = models.BooleanField(default=False)
 
+    objects = GameQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["appid"], name="unique appid")
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.appid})"
 
-    def get_votes_for_event(self, event: Event):
-        return Vote.objects.filter(game=self, event=event).order_by("username")
 
-    def get_comments_for_event(self, event: Event) -> List[Event]:
-        return get_comments(event=event, game=self)
+class SteamAppDetails(TimestampedMixin, models.Model):
+    """Cached response of the Steam appdetails API for one app."""
 
-    def get_added_by_username_for_event(self, event) -> str:
-        return EventGame.objects.get(event=event, game=self).added_by_username
+    appid = models.PositiveIntegerField(unique=True)
+    data = models.JSONField(null=True, blank=True, default=None)
+    """None if Steam has no details for the app."""
+
+    def __str__(self):
+        return f"Details for {self.appid}"
 
 
 class Vote(TimestampedMixin, models.Model):
@@ -117,19 +243,33 @@ class Vote(TimestampedMixin, models.Model):
         constraints = [
             models.UniqueConstraint(
                 fields=["event", "game", "username"], name="unique vote"
-            )
+            ),
+            # Only one superlike per user and Event.
+            models.UniqueConstraint(
+                fields=["event", "username"],
+                condition=Q(is_superlike=True),
+                name="unique superlike",
+            ),
+        ]
+        indexes = [
+            # Votes of an Event by username, e.g. for the scoreboard.
+            models.Index(fields=["event", "username"], name="vote_event_username_idx")
         ]
 
     def __str__(self):
         return f"{self.username} wants to play '{self.game}' during '{self.event}'"
 
     def save(self, *args, **kwargs):
-        if not self.game in self.event.games.all():
+        if not EventGame.objects.filter(
+            event_id=self.event_id, game_id=self.game_id
+        ).exists():
             raise ValidationError(
                 f"Can only vote for game that belongs to event {self.event}, "
                 f"but tried to vote for {self.game}"
             )
-        super().save(*args, **kwargs)
+        # Count it in the same transaction, see gamedoodle.core.counters.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 
 class Comment(TimestampedMixin, models.Model):
@@ -142,7 +282,26 @@ class Comment(TimestampedMixin, models.Model):
 
     username = models.CharField(max_length=256)
     text = models.TextField()
+    text_html = models.TextField(default="", blank=True, editable=False)
+    """The text rendered by render_comment_html() on save."""
     softdeleted = models.BooleanField(default=False)
+    alignment = models.CharField(max_length=8, default="left", editable=False)
+    """Side to render on like a chat, set on creation."""
+
+    class Meta:
+        indexes = [
+            # Visible comments of an Event or of a Game on it, in order.
+            models.Index(
+                fields=["event", "created_at"],
+                condition=Q(softdeleted=False),
+                name="comment_event_visible_idx",
+            ),
+            models.Index(
+                fields=["event", "game", "created_at"],
+                condition=Q(softdeleted=False),
+                name="comment_game_visible_idx",
+            ),
+        ]
 
     def __str__(self):
         if self.game:
@@ -150,12 +309,33 @@ class Comment(TimestampedMixin, models.Model):
         return f"{self.username} commented during '{self.event}'"
 
     def save(self, *args, **kwargs):
-        if self.game and not self.game in self.event.games.all():
+        if self.game_id and not EventGame.objects.filter(
+            event_id=self.event_id, game_id=self.game_id
+        ).exists():
             raise ValidationError(
                 f"Can only comment on game that belongs to event {self.event}, "
                 f"but tried to comment on {self.game}"
             )
-        super().save(*args, **kwargs)
+        if self._state.adding:
+            # Continue the thread where it is, instead of aligning all
+            # comments again on every read.
+            previous_comment = (
+                Comment.objects.filter(
+                    event_id=self.event_id, game_id=self.game_id, softdeleted=False
+                )
+                .order_by("-created_at", "-id")
+                .only("username", "alignment")
+                .first()
+            )
+            augment_comment_alignment([self], previous_comment)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "text" in update_fields:
+            self.text_html = render_comment_html(self.text)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "text_html"}
+        # Count it in the same transaction, see gamedoodle.core.counters.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     @property
     def is_new(self):
@@ -166,22 +346,10 @@ class Comment(TimestampedMixin, models.Model):
 
     @property
     def text_as_html(self):
-        """Clean, linkify and prevent link overflow.
-
-        See:
-
-        - https://bleach.readthedocs.io/en/latest/linkify.html#linkify-linkifyfilter
-        - https://github.com/mozilla/bleach/blob/24c21bb8a20d0c72a44fee81c290f41774e8384e/bleach/callbacks.py
-
-        """
-
-        def break_word(attrs, new=False):
-            attrs[(None, "style")] = "word-break: break-word"
-            return attrs
-
-        callbacks = bleach.linkifier.DEFAULT_CALLBACKS + [break_word]
-        filters = [partial(LinkifyFilter, callbacks=callbacks)]
-        return Cleaner(filters=filters).clean(self.text)
+        if not self.text_html and self.text:
+            # Not backfilled yet, see the backfill_comment_html command.
+            return render_comment_html(self.text)
+        return self.text_html
 
     @property
     def short_preview(self):
@@ -202,34 +370,114 @@ class SentMail(TimestampedMixin, models.Model):
     html = models.TextField()
 
 
-def get_comments(
-    event: Event,
-    game: Optional[Game] = None,
-    ignore_softdeleted: bool = True,
-    augment_alignment: bool = True
-) -> List[Comment]:
-    comments = Comment.objects.filter(event=event, game=game)
-    if ignore_softdeleted:
-        comments = comments.exclude(softdeleted=True)
-    comments = list(comments.order_by("created_at"))
-
-    if augment_alignment:
-        comments = comments
-        current_alignment: str = "left"
-        for i, comment in enumerate(comments):
-            try:
-                previous_comment = comments[i - 1]
-            except IndexError:
-                previous_comment = None
-            if previous_comment and previous_comment.username == comment.username:
-                current_alignment = getattr(
-                    previous_comment, "alignment", current_alignment
-                )
+class Checkpoint(TimestampedMixin, models.Model):
+    """Progress of a long running job, to continue where it stopped."""
+
+    name = models.CharField(max_length=256, unique=True)
+    value = models.CharField(max_length=256, default="", blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    @classmethod
+    def get_value(cls, name: str, default: str = "") -> str:
+        checkpoint = cls.objects.filter(name=name).first()
+        return checkpoint.value if checkpoint else default
+
+    @classmethod
+    def set_value(cls, name: str, value: str):
+        cls.objects.update_or_create(name=name, defaults={"value": value})
+
+
+class Job(TimestampedMixin, models.Model):
+    """A slow task to be run in the background by the run_worker command."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    DEAD = "dead"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (DEAD, "Dead"),  # Failed too often, will not be retried.
+    )
 
-            comment.alignment = current_alignment
+    task = models.CharField(max_length=256)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True, default=None)
+    last_error = models.TextField(default="", blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"{self.task}({self.kwargs}) [{self.status}]"
+
+
+class Activity(models.Model):
+    """Something a user did on an Event, to be listed in digests.
+
+    Append-only, written together with the change, see
+    gamedoodle.core.votes.
+
+    """
+
+    VOTE = "vote"
+    UNVOTE = "unvote"
+    SUPERLIKE = "superlike"
+    UNSUPERLIKE = "unsuperlike"
+    COMMENT = "comment"
+    ADD_GAME = "add_game"
+    KIND_CHOICES = (
+        (VOTE, "Vote"),
+        (UNVOTE, "Unvote"),
+        (SUPERLIKE, "Superlike"),
+        (UNSUPERLIKE, "Unsuperlike"),
+        (COMMENT, "Comment"),
+        (ADD_GAME, "Add game"),
+    )
 
-            if current_alignment == "left":
-                current_alignment = "right"
-            else:
-                current_alignment = "left"
+    created_at = models.DateTimeField(default=timezone.now)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    actor = models.CharField(max_length=256, default="", blank=True)
+    game = models.ForeignKey(
+        Game, on_delete=models.SET_NULL, null=True, blank=True, default=None
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    """E.g. comment_id and preview for comments."""
+
+    class Meta:
+        verbose_name_plural = "activities"
+        indexes = [models.Index(fields=["event", "created_at"])]
+
+    def __str__(self):
+        return f"{self.actor} {self.kind} {self.game_id or ''} on {self.event_id}"
+
+
+def augment_comment_alignment(
+    comments: List[Comment], previous_comment: Optional[Comment] = None
+) -> List[Comment]:
+    """Set .alignment on each comment to render them like a chat.
+
+    Consecutive comments by the same user stay on the same side. Pass
+    the comment before the first one to continue its thread, otherwise
+    the first one is on the left.
+
+    """
+    for comment in comments:
+        if previous_comment is None:
+            comment.alignment = "left"
+        elif previous_comment.username == comment.username:
+            comment.alignment = previous_comment.alignment
+        elif previous_comment.alignment == "left":
+            comment.alignment = "right"
+        else:
+            comment.alignment = "left"
+        previous_comment = comment
     return comments
@@ -0,0 +1,178 @@
+"""Bounded retention for tables that grow with every request.
+
+Each RetentionPolicy decides which rows of a table have expired. Expired
+rows are appended to a gzipped JSON lines archive and deleted in small
+batches, each in its own transaction, so SQLite is never write locked
+for long. See the compact_history command.
+
+A batch is written to disk before its rows are deleted. If the delete
+fails, the next run archives those rows again, so readers of the archive
+have to skip rows with an id they have already seen.
+
+"""
+import gzip
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db import transaction
+from django.db.models import F
+from django.db.models import Q
+from django.db.models import Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from easyaudit.models import CRUDEvent
+
+from gamedoodle.core.digests import LAST_ACTIVITY_ID_CHECKPOINT
+from gamedoodle.core.models import Activity
+from gamedoodle.core.models import Checkpoint
+from gamedoodle.core.models import SentMail
+
+
+@dataclass
+class RetentionPolicy:
+    """Which rows of a model to keep.
+
+    A row expires if it is older than max_age or beyond the newest
+    max_rows, unless it is one of the newest keep_last_per_group rows
+    with the same value in group_field.
+
+    """
+
+    model: type
+    datetime_field: str
+    max_age: Optional[timedelta] = None
+    max_rows: Optional[int] = None
+    group_field: Optional[str] = None
+    keep_last_per_group: int = 0
+    get_queryset: Optional[Callable[[], models.QuerySet]] = None
+    """Limit rows that may expire at all, defaults to all rows."""
+
+    @property
+    def name(self) -> str:
+        return self.model._meta.label
+
+    def get_expired(self) -> models.QuerySet:
+        expired_filter = Q(pk__in=[])
+        if self.max_age is not None:
+            cutoff = timezone.now() - self.max_age
+            expired_filter |= Q(**{f"{self.datetime_field}__lt": cutoff})
+        if self.max_rows is not None:
+            oldest_kept_ids = list(
+                self.model.objects.order_by("-id").values_list("id", flat=True)[
+                    self.max_rows - 1 : self.max_rows
+                ]
+            )
+            if oldest_kept_ids:
+                expired_filter |= Q(id__lt=oldest_kept_ids[0])
+
+        queryset = (
+            self.get_queryset() if self.get_queryset else self.model.objects.all()
+        )
+        expired = queryset.filter(expired_filter)
+        if self.group_field and self.keep_last_per_group:
+            kept_ids = (
+                self.model.objects.annotate(
+                    position=Window(
+                        RowNumber(),
+                        partition_by=F(self.group_field),
+                        order_by=F("id").desc(),
+                    )
+                )
+                .filter(position__lte=self.keep_last_per_group)
+                .values("id")
+            )
+            expired = expired.exclude(id__in=kept_ids)
+        return expired.order_by("id")
+
+
+def _keep_activities_not_in_digest():
+    # Rows after the high-water mark are still needed for the next digest.
+    last_activity_id = int(Checkpoint.get_value(LAST_ACTIVITY_ID_CHECKPOINT, "0"))
+    return Activity.objects.filter(id__lte=last_activity_id)
+
+
+def get_policies() -> List[RetentionPolicy]:
+    policies = settings.RETENTION["POLICIES"]
+    return [
+        RetentionPolicy(
+            model=SentMail,
+            datetime_field="created_at",
+            max_age=timedelta(days=policies["SentMail"]["MAX_AGE_DAYS"]),
+            max_rows=policies["SentMail"]["MAX_ROWS"],
+            group_field="recipient",
+            keep_last_per_group=policies["SentMail"]["KEEP_LAST_PER_RECIPIENT"],
+        ),
+        RetentionPolicy(
+            model=CRUDEvent,
+            datetime_field="datetime",
+            max_age=timedelta(days=policies["CRUDEvent"]["MAX_AGE_DAYS"]),
+            max_rows=policies["CRUDEvent"]["MAX_ROWS"],
+        ),
+        RetentionPolicy(
+            model=Activity,
+            datetime_field="created_at",
+            max_age=timedelta(days=policies["Activity"]["MAX_AGE_DAYS"]),
+            max_rows=policies["Activity"]["MAX_ROWS"],
+            get_queryset=_keep_activities_not_in_digest,
+        ),
+    ]
+
+
+def get_archive_path(policy: RetentionPolicy) -> Path:
+    archive_dir = Path(settings.RETENTION["ARCHIVE_DIR"])
+    return archive_dir / f"{policy.name}-{timezone.now():%Y-%m}.jsonl.gz"
+
+
+def _append_to_archive(archive_path: Path, rows: List[dict]):
+    with open(archive_path, "ab") as raw_file:
+        # Appending adds a gzip member, which gunzip reads as one file.
+        with gzip.GzipFile(fileobj=raw_file, mode="ab") as gzip_file:
+            for row in rows:
+                line = json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+                gzip_file.write(line.encode("utf-8"))
+        raw_file.flush()
+        os.fsync(raw_file.fileno())
+
+
+def compact(
+    policy: RetentionPolicy,
+    batch_size: int,
+    archive: bool = True,
+    pause_seconds: float = 0,
+) -> int:
+    """Archive and delete expired rows batch by batch, return their number."""
+    num_deleted = 0
+    archive_path = get_archive_path(policy)
+    if archive:
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Rows only expire further while we delete, so select them once.
+    expired_ids = list(policy.get_expired().values_list("id", flat=True))
+    for start in range(0, len(expired_ids), batch_size):
+        batch_ids = expired_ids[start : start + batch_size]
+        rows = list(
+            policy.model.objects.filter(id__in=batch_ids).order_by("id").values()
+        )
+        if archive:
+            _append_to_archive(archive_path, rows)
+        with transaction.atomic():
+            policy.model.objects.filter(id__in=[row["id"] for row in rows]).delete()
+        num_deleted += len(rows)
+        # Let waiting writers in between batches.
+        time.sleep(pause_seconds)
+    return num_deleted
+
+
+def count_expired() -> Dict[str, int]:
+    return {policy.name: policy.get_expired().count() for policy in get_policies()}
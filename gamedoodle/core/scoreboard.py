@@ -0,0 +1,82 @@
+from collections import defaultdict
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from gamedoodle.core.caching import get_or_set_event_cache
+from gamedoodle.core.comments import CommentSummary
+from gamedoodle.core.comments import get_comment_summaries
+from gamedoodle.core.models import Event
+from gamedoodle.core.models import Game
+from gamedoodle.core.models import Vote
+
+
+def build_scoreboard(
+    event: Event, username: Optional[str], version: Optional[int] = None
+) -> List[Game]:
+    """Return the Games of an Event annotated and sorted for display.
+
+    Games are scored and ranked by the database (see
+    GameQuerySet.with_event_score), Votes of the Event are loaded in one
+    query and grouped in memory, and comments are counted and previewed
+    in two queries for all Games, so the number of queries does not
+    depend on the number of Games, Votes or Comments.
+
+    If an Event version is given (see gamedoodle.core.caching), the
+    loaded data is cached for it and no queries are needed until the
+    Event changes.
+
+    Besides the with_event_score annotations, each Game gets these
+    attributes set:
+
+    - votes (list[Vote]): Ordered by username.
+    - current_user_can_vote (bool)
+    - current_user_can_superlike (bool)
+    - comment_summary (CommentSummary): Number and latest of its
+      visible comments, see gamedoodle.core.comments.
+
+    The summary of the general comments is set as event.comment_summary.
+
+    """
+    if version is None:
+        games, event_comment_summary = _load_scoreboard(event)
+    else:
+        games, event_comment_summary = get_or_set_event_cache(
+            event.id, version, "scoreboard", lambda: _load_scoreboard(event)
+        )
+    event.comment_summary = event_comment_summary
+
+    username_has_superliked = any(
+        vote.username == username and vote.is_superlike
+        for game in games
+        for vote in game.votes
+    )
+    for game in games:
+        own_vote = next(
+            (vote for vote in game.votes if vote.username == username), None
+        )
+        game.current_user_can_vote = own_vote is None
+        game.current_user_can_superlike = (
+            own_vote is not None
+            and not own_vote.is_superlike
+            and not username_has_superliked
+        )
+
+    return games
+
+
+def _load_scoreboard(event: Event) -> Tuple[List[Game], CommentSummary]:
+    games = list(Game.objects.with_event_score(event))
+    votes = Vote.objects.filter(event=event).order_by("username")
+    comment_summaries = get_comment_summaries(event)
+
+    votes_by_game_id: Dict[int, List[Vote]] = defaultdict(list)
+    for vote in votes:
+        votes_by_game_id[vote.game_id].append(vote)
+
+    for game in games:
+        game.votes = votes_by_game_id[game.id]
+        game.comment_summary = comment_summaries[game.id]
+
+    return games, comment_summaries[None]
@@ -0,0 +1,143 @@
+"""Search index for Game names.
+
+On SQLite, names are kept in an FTS5 table using the trigram tokenizer
+(see migration 0016), which supports substring matches without scanning
+the whole Game table. On PostgreSQL, a pg_trgm GIN index on the name
+column is used by the regular icontains lookups instead.
+
+Results are ranked by relevance: names starting with the search text
+first, then names containing it at the start of a word, then games that
+have been added to more Events before, then shorter names.
+
+"""
+from typing import Iterable
+from typing import List
+
+from django.db import connection
+from django.db.models import Case
+from django.db.models import Count
+from django.db.models import IntegerField
+from django.db.models import Q
+from django.db.models import Value
+from django.db.models import When
+from django.db.models.functions import Length
+
+from gamedoodle.core.models import Game
+
+SEARCH_TABLE = "core_game_search"
+
+# Shorter substrings can not be looked up in a trigram index.
+MIN_TRIGRAM_LENGTH = 3
+
+
+def uses_fts_index() -> bool:
+    return connection.vendor == "sqlite"
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _search_games_with_fts(
+    search_text: str, words: List[str], limit: int
+) -> List[Game]:
+    trigram_words = [word for word in words if len(word) >= MIN_TRIGRAM_LENGTH]
+    short_words = [word for word in words if len(word) < MIN_TRIGRAM_LENGTH]
+
+    # Each word as a quoted phrase, which FTS5 combines with AND.
+    match_query = " ".join(
+        '"{}"'.format(word.replace('"', '""')) for word in trigram_words
+    )
+    short_word_conditions = "".join(
+        " AND g.name LIKE %s ESCAPE '\\'" for _ in short_words
+    )
+    sql = f"""
+        SELECT g.*
+        FROM {SEARCH_TABLE} s
+        JOIN core_game g ON g.id = s.rowid
+        WHERE {SEARCH_TABLE} MATCH %s{short_word_conditions}
+        ORDER BY
+            CASE
+                WHEN g.name LIKE %s ESCAPE '\\' THEN 0
+                WHEN g.name LIKE %s ESCAPE '\\' THEN 1
+                ELSE 2
+            END,
+            (
+                SELECT COUNT(*) FROM core_eventgame eg WHERE eg.game_id = g.id
+            ) DESC,
+            length(g.name),
+            g.name
+        LIMIT %s
+    """
+    escaped = _escape_like(search_text)
+    params = (
+        [match_query]
+        + [f"%{_escape_like(word)}%" for word in short_words]
+        + [f"{escaped}%", f"% {escaped}%", limit]
+    )
+    return list(Game.objects.raw(sql, params))
+
+
+def _search_games_with_orm(
+    search_text: str, words: List[str], limit: int
+) -> List[Game]:
+    words_query = Q()
+    for word in words:
+        words_query &= Q(name__icontains=word)
+
+    return list(
+        Game.objects.filter(Q(name__icontains=search_text) | words_query)
+        .annotate(
+            match_rank=Case(
+                When(name__istartswith=search_text, then=Value(0)),
+                When(name__icontains=f" {search_text}", then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            ),
+            popularity=Count("eventgame"),
+        )
+        .order_by("match_rank", "-popularity", Length("name"), "name")[:limit]
+    )
+
+
+def search_games(search_text: str, limit: int = 100) -> List[Game]:
+    """Return the most relevant Games whose name contains all words."""
+    search_text = search_text.strip()
+    words = search_text.split()
+    if not words:
+        return []
+
+    has_trigram_word = any(len(word) >= MIN_TRIGRAM_LENGTH for word in words)
+    if uses_fts_index() and has_trigram_word:
+        return _search_games_with_fts(search_text, words, limit)
+    return _search_games_with_orm(search_text, words, limit)
+
+
+def index_games(games: Iterable[Game]):
+    """Add or update given Games in the search index."""
+    if not uses_fts_index():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {SEARCH_TABLE}(rowid, name) VALUES (%s, %s)",
+            [(game.id, game.name) for game in games],
+        )
+
+
+def unindex_game(game_id: int):
+    if not uses_fts_index():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [game_id])
+
+
+def rebuild_index() -> int:
+    """Recreate the search index from all Games, return number of Games."""
+    if not uses_fts_index():
+        return Game.objects.count()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}(rowid, name) SELECT id, name FROM core_game"
+        )
+        return cursor.rowcount
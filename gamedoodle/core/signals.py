@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from gamedoodle.core.caching import bump_event_version
+from gamedoodle.core.counters import count_vote
+from gamedoodle.core.counters import recount_comments
+from gamedoodle.core.counters import uncount_vote
+from gamedoodle.core.live import get_broker
+from gamedoodle.core.models import Comment
+from gamedoodle.core.models import Event
+from gamedoodle.core.models import EventGame
+from gamedoodle.core.models import Game
+from gamedoodle.core.models import Vote
+from gamedoodle.core.search import index_games
+from gamedoodle.core.search import unindex_game
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def _event_changed(event_id: int, game_id=None):
+    """Invalidate cached fragments and notify live clients of an Event.
+
+    Only once the write is committed, otherwise concurrent requests could
+    cache what they still read from before under the new version.
+
+    """
+
+    def bump_and_publish():
+        bump_event_version(event_id)
+        get_broker().publish(event_id, game_id)
+
+    transaction.on_commit(bump_and_publish)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def bump_version_of_event(sender, instance, **kwargs):
+    _event_changed(instance.id)
+
+
+@receiver(post_save, sender=EventGame)
+@receiver(post_delete, sender=EventGame)
+def bump_version_of_event_games(sender, instance, **kwargs):
+    _event_changed(instance.event_id)
+
+
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_version_of_related_event(sender, instance, **kwargs):
+    _event_changed(instance.event_id, instance.game_id)
+
+
+@receiver(post_save, sender=Vote)
+def count_new_vote(sender, instance, created, **kwargs):
+    if created:
+        count_vote(instance.event_id, instance.username)
+
+
+@receiver(post_delete, sender=Vote)
+def uncount_deleted_vote(sender, instance, **kwargs):
+    uncount_vote(instance.event_id, instance.username)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def recount_comments_of_event(sender, instance, **kwargs):
+    if instance.game_id is None:
+        recount_comments(instance.event_id)
+
+
+@receiver(post_save, sender=Game)
+def bump_version_of_events_with_game(sender, instance, created, **kwargs):
+    if created:
+        return
+    for event_id in EventGame.objects.filter(game=instance).values_list(
+        "event_id", flat=True
+    ):
+        _event_changed(event_id, instance.id)
+
+
+@receiver(post_save, sender=Game)
+def update_search_index_for_game(sender, instance, **kwargs):
+    index_games([instance])
+
+
+@receiver(post_delete, sender=Game)
+def remove_game_from_search_index(sender, instance, **kwargs):
+    unindex_game(instance.id)
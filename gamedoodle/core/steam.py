@@ -0,0 +1,108 @@
+"""Client for the Steam store API.
+
+All requests share one pooled session with timeouts and retries, and
+appdetails responses are cached in the database (see SteamAppDetails).
+
+"""
+from datetime import timedelta
+from typing import Optional
+
+import requests
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from gamedoodle.core.models import Game
+from gamedoodle.core.models import SteamAppDetails
+
+_session: Optional[requests.Session] = None
+
+
+def get_session() -> requests.Session:
+    """Shared session, retrying failed requests with exponential backoff."""
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=settings.STEAM_API_RETRIES,
+            backoff_factor=settings.STEAM_API_BACKOFF_FACTOR,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=16)
+        _session = requests.Session()
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+
+def request_app_details(appid: int) -> Optional[dict]:
+    """Fetch details of a Steam app, None if Steam has none.
+
+    Raises requests.RequestException if Steam can not be reached.
+
+    """
+    url = settings.STEAM_API_BASE_URL_APPDETAILS + str(appid)
+    response = get_session().get(url, timeout=settings.STEAM_API_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    raw: dict = (response.json() or {}).get(str(appid), {})
+    if not raw.get("success", False):
+        return None
+    return raw["data"]
+
+
+def get_fresh_app_details() -> QuerySet:
+    """Cached details that have not expired yet."""
+    max_age = timedelta(seconds=settings.STEAM_APP_DETAILS_CACHE_SECONDS)
+    return SteamAppDetails.objects.filter(modified_at__gte=timezone.now() - max_age)
+
+
+def get_cached_app_details(appid: int) -> Optional[SteamAppDetails]:
+    return get_fresh_app_details().filter(appid=appid).first()
+
+
+def store_app_details(appid: int, data: Optional[dict]):
+    SteamAppDetails.objects.update_or_create(appid=appid, defaults={"data": data})
+
+
+def get_app_details(appid: int) -> Optional[dict]:
+    """Details of a Steam app, from the cache if fetched recently."""
+    cached = get_cached_app_details(appid)
+    if cached:
+        return cached.data
+    data = request_app_details(appid)
+    store_app_details(appid, data)
+    return data
+
+
+def get_store_url(appid: int) -> str:
+    return settings.STEAM_STORE_PAGE_BASE_URL + str(appid)
+
+
+def apply_app_details(game: Game, data: Optional[dict]):
+    """Set store url, image and is_free from details (without saving)."""
+    if not game.store_url:
+        game.store_url = get_store_url(game.appid)
+    if data is None:
+        return
+
+    screenshots = data.get("screenshots", [])
+    if game.image_url == "" and screenshots:
+        first_thumbnail = screenshots[0]["path_thumbnail"]
+        game.image_url = first_thumbnail
+
+    game.is_free = data.get("is_free", game.is_free)
+
+
+def enrich_game(game: Game):
+    """Set and save details of a Game from Steam, if it is a Steam game.
+
+    Raises if Steam can not be reached, see the enrich_game_from_steam
+    task, which retries it later.
+
+    """
+    if game.appid is None:
+        return
+    apply_app_details(game, get_app_details(game.appid))
+    game.save()
@@ -0,0 +1,21 @@
+"""Tasks that can be enqueued to run in the background, see jobs.py."""
+from gamedoodle.core.jobs import task
+from gamedoodle.core.mailing import send_email_via_gmail
+from gamedoodle.core.models import Game
+from gamedoodle.core.steam import enrich_game
+
+
+@task
+def enrich_game_from_steam(game_id: int):
+    """Set and save details of a Game from Steam, see enrich_game()."""
+    enrich_game(Game.objects.get(id=game_id))
+
+
+@task
+def send_email(**kwargs):
+    """Send email, see send_email_via_gmail() for kwargs.
+
+    Emails sent by the worker share one SMTP connection.
+
+    """
+    send_email_via_gmail(**kwargs)
@@ -1,3 +1,1415 @@
+import gzip
+import json
+import smtplib
+import socketserver
+import tempfile
+import threading
+from datetime import timedelta
+from email import message_from_string
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from unittest import skipUnless
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.db import IntegrityError
+from django.db import connection
+from django.db.models import Q
+from django.db.models import QuerySet
 from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from gamedoodle.core.autocomplete import GameNameIndex
+from gamedoodle.core.autocomplete import suggest_games
+from gamedoodle.core.caching import get_event_version
+from gamedoodle.core.comments import COMMENTS_PER_PAGE
+from gamedoodle.core.comments import get_comment_page
+from gamedoodle.core.comments import get_comment_summaries
+from gamedoodle.core.jobs import enqueue
+from gamedoodle.core.jobs import task
+from gamedoodle.core.live import get_broker
+from gamedoodle.core.management.commands.fetch_all_steam_games import upsert_games
+from gamedoodle.core.management.commands.load_test_sqlite import run_load
+from gamedoodle.core.mailing import GmailMailer
+from gamedoodle.core.digests import LAST_ACTIVITY_ID_CHECKPOINT
+from gamedoodle.core.instrumentation import InstrumentationMiddleware
+from gamedoodle.core.instrumentation import QueryBudgetExceeded
+from gamedoodle.core.models import ACTIVITIES_STARTED_AT_CHECKPOINT
+from gamedoodle.core.models import Activity
+from gamedoodle.core.models import Checkpoint
+from gamedoodle.core.models import Comment
+from gamedoodle.core.models import Event
+from gamedoodle.core.models import EventGame
+from gamedoodle.core.models import EventParticipant
+from gamedoodle.core.models import EventSubscription
+from gamedoodle.core.models import Game
+from gamedoodle.core.models import Job
+from gamedoodle.core.models import SentMail
+from gamedoodle.core.models import SteamAppDetails
+from gamedoodle.core.models import Vote
+from gamedoodle.core.models import augment_comment_alignment
+from gamedoodle.core.scoreboard import build_scoreboard
+from gamedoodle.core.search import search_games
+from gamedoodle.core.steam import enrich_game
+from gamedoodle.core.tasks import send_email
+from gamedoodle.core.votes import add_vote
+from gamedoodle.core.votes import remove_vote
+from gamedoodle.core.votes import superlike_vote
+from gamedoodle.core.votes import unsuperlike_vote
+
+
+def _add_game(event, name, usernames=(), superlike_usernames=()):
+    game = Game.objects.create(name=name)
+    EventGame.objects.create(event=event, game=game, added_by_username="Alice")
+    for username in usernames:
+        Vote.objects.create(
+            event=event,
+            game=game,
+            username=username,
+            is_superlike=username in superlike_usernames,
+        )
+    return game
+
+
+class EventDetailTestCase(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event = Event.objects.create(name="LAN")
+        session = self.client.session
+        session["username"] = "Alice"
+        session.save()
+
+    def _get_event_detail(self, status_code=200, **headers):
+        url = reverse("event-detail", kwargs={"uuid": self.event.uuid})
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, status_code)
+        return response
+
+    def test_scoreboard_ranks_numerically(self):
+        many_voters = [f"User{i}" for i in range(10)]
+        _add_game(self.event, "Nine", many_voters[:9])
+        _add_game(self.event, "Ten", many_voters)
+        _add_game(self.event, "Also Nine", many_voters[1:])
+
+        games = build_scoreboard(self.event, "User0")
+
+        self.assertEqual(
+            [(game.name, game.voting_rank) for game in games],
+            [("Ten", 1), ("Also Nine", 2), ("Nine", 2)],
+        )
+        self.assertEqual(games[0].added_by_username, "Alice")
+        self.assertFalse(games[0].current_user_can_vote)
+        self.assertTrue(games[0].current_user_can_superlike)
+        self.assertTrue(games[1].current_user_can_vote)
+        self.assertFalse(games[1].current_user_can_superlike)
+
+    def test_scoreboard_adds_superlike_fraction(self):
+        _add_game(self.event, "Liked", ["Alice", "Bob"])
+        _add_game(self.event, "Superliked", ["Alice", "Bob"], ["Alice"])
+
+        games = build_scoreboard(self.event, "Alice")
+
+        self.assertEqual(games[0].name, "Superliked")
+        self.assertEqual(games[0].votes_value, 2.5)
+        self.assertEqual(games[1].votes_value, 2)
+        self.assertFalse(games[1].current_user_can_superlike)
+
+    def test_event_detail_query_count_does_not_grow_with_games(self):
+        game = _add_game(self.event, "First", ["Alice"])
+        Comment.objects.create(event=self.event, game=game, username="Bob", text="!")
+        with self.assertNumQueries(8):
+            self._get_event_detail()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(20):
+                game = _add_game(self.event, f"Game {i}", ["Alice", "Bob", "Carol"])
+                Comment.objects.create(
+                    event=self.event, game=game, username="Bob", text="!"
+                )
+            Comment.objects.create(event=self.event, username="Carol", text="Hi")
+        with self.assertNumQueries(8):
+            self._get_event_detail()
+
+    def test_event_detail_is_cached_until_event_changes(self):
+        game = _add_game(self.event, "First", ["Bob"])
+        self._get_event_detail()
+
+        with self.assertNumQueries(3):
+            response = self._get_event_detail()
+        self.assertNotContains(response, "Carol")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Vote.objects.create(event=self.event, game=game, username="Carol")
+        with self.assertNumQueries(8):
+            response = self._get_event_detail()
+        self.assertContains(response, "Carol")
+
+    def test_event_detail_answers_conditional_get(self):
+        game = _add_game(self.event, "First", ["Bob"])
+        etag = self._get_event_detail()["ETag"]
+
+        with self.assertNumQueries(2):
+            self._get_event_detail(status_code=304, if_none_match=etag)
+
+        self._get_event_detail(status_code=200, if_none_match=etag, hx_request="true")
+
+        Vote.objects.filter(event=self.event, game=game, username="Bob").delete()
+        response = self._get_event_detail(status_code=200, if_none_match=etag)
+        self.assertNotEqual(response["ETag"], etag)
+
+    async def test_live_updates_stream_changed_game_card(self):
+        game = await sync_to_async(_add_game)(self.event, "First", ["Bob"])
+        self.async_client.cookies = self.client.cookies
+        url = reverse("event-live-updates", kwargs={"uuid": self.event.uuid})
+        response = await self.async_client.get(url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        stream = response.streaming_content
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+
+        get_broker().publish(self.event.id, game.id)
+        chunk = (await anext(stream)).decode()
+        self.assertTrue(chunk.startswith(f"event: game-{game.id}\n"))
+        self.assertIn(f'data:   id="game-{game.id}"', chunk)
+
+        get_broker().publish(self.event.id)
+        self.assertEqual(
+            (await anext(stream)).decode(),
+            f"event: event-changed\ndata: {self.event.uuid}\n\n",
+        )
+        await stream.aclose()
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.event = Event.objects.create(name="LAN")
+        session = self.client.session
+        session["username"] = "Alice"
+        session.save()
+        self.url = reverse("event-detail", kwargs={"uuid": self.event.uuid})
+
+    def test_adds_server_timing(self):
+        with self.assertLogs("gamedoodle.core.instrumentation", "INFO") as logs:
+            response = self.client.get(self.url)
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^sql;desc="\d+ queries";dur=[\d.]+, template;dur=[\d.]+, '
+            r"total;dur=[\d.]+$",
+        )
+        self.assertEqual(logs.records[0].view_name, "event-detail")
+        self.assertGreater(logs.records[0].num_queries, 0)
+        self.assertGreater(logs.records[0].template_ms, 0)
+
+    def test_enforces_query_budgets(self):
+        budgets = {"event-detail": 1}
+        with self.settings(
+            INSTRUMENTATION={**settings.INSTRUMENTATION, "QUERY_BUDGETS": budgets}
+        ):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "budget is 1"):
+                self.client.get(self.url)
+
+            with self.settings(
+                INSTRUMENTATION={
+                    **settings.INSTRUMENTATION,
+                    "ENFORCE_QUERY_BUDGETS": False,
+                }
+            ):
+                with self.assertLogs("gamedoodle.core.instrumentation", "WARNING"):
+                    self.client.get(self.url)
+
+    def test_removes_itself_when_disabled(self):
+        with self.settings(
+            INSTRUMENTATION={**settings.INSTRUMENTATION, "ENABLED": False}
+        ):
+            with self.assertRaises(MiddlewareNotUsed):
+                InstrumentationMiddleware(lambda request: None)
+
+
+@skipUnless(connection.vendor == "sqlite", "Checks SQLite query plans")
+class QueryPlanTestCase(TestCase):
+    """Hot queries of the event detail page must be served by an index."""
+
+    def setUp(self):
+        self.event = Event.objects.create(name="LAN")
+        self.game = _add_game(self.event, "Quake", usernames=["Alice"])
+
+    def assertUsesIndex(self, queryset, index_name="sqlite_autoindex"):
+        plan = queryset.explain()
+        self.assertIn(f"USING INDEX {index_name}", plan)
+        self.assertNotIn("SCAN", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_lookups_by_uuid(self):
+        self.assertUsesIndex(Event.objects.filter(uuid=self.event.uuid))
+        self.assertUsesIndex(EventSubscription.objects.filter(uuid=self.event.uuid))
+
+    def test_votes_and_games_of_event(self):
+        self.assertUsesIndex(
+            Vote.objects.filter(event=self.event).order_by("username"),
+            "vote_event_username_idx",
+        )
+        self.assertUsesIndex(EventGame.objects.filter(event=self.event, game=self.game))
+
+    def test_visible_comments_of_event(self):
+        self.assertUsesIndex(
+            Comment.objects.filter(event=self.event)
+            .exclude(softdeleted=True)
+            .order_by("created_at"),
+            "comment_event_visible_idx",
+        )
+        for game in [self.game, None]:
+            self.assertUsesIndex(
+                Comment.objects.filter(event=self.event, game=game)
+                .exclude(softdeleted=True)
+                .order_by("created_at"),
+                "comment_game_visible_idx",
+            )
+
+    def test_comment_pages(self):
+        comment = Comment.objects.create(event=self.event, username="Alice", text="!")
+        for game in [self.game, None]:
+            self.assertUsesIndex(
+                Comment.objects.filter(event=self.event, game=game, softdeleted=False)
+                .filter(
+                    Q(created_at__lt=comment.created_at)
+                    | Q(created_at=comment.created_at, id__lt=comment.id)
+                )
+                .order_by("-created_at", "-id"),
+                "comment_game_visible_idx",
+            )
+
+
+class VotesTestCase(TestCase):
+    def setUp(self):
+        self.event = Event.objects.create(name="LAN")
+        self.game = _add_game(self.event, "Quake")
+
+    def test_votes_once(self):
+        version = get_event_version(self.event.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            vote = add_vote(self.event, self.game.id, "Alice")
+            # Concurrent requests must not cache what they read before
+            # the commit under a new version.
+            self.assertEqual(get_event_version(self.event.id), version)
+        self.assertEqual(Vote.objects.get(), vote)
+        self.assertNotEqual(get_event_version(self.event.id), version)
+
+        self.assertIsNone(add_vote(self.event, self.game.id, "Alice"))
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_logs_activity_in_the_same_transaction(self):
+        with mock.patch(
+            "gamedoodle.core.votes.Activity.objects.create",
+            side_effect=IntegrityError,
+        ):
+            with self.assertRaises(IntegrityError):
+                add_vote(self.event, self.game.id, "Alice")
+        self.assertFalse(Vote.objects.exists())
+
+        vote = add_vote(self.event, self.game.id, "Alice")
+        superlike_vote(self.event, self.game.id, "Alice")
+        remove_vote(self.event, vote.id, "Alice")
+        self.assertEqual(
+            list(Activity.objects.values_list("kind", flat=True).order_by("id")),
+            [Activity.VOTE, Activity.SUPERLIKE, Activity.UNVOTE],
+        )
+
+    def test_only_votes_for_games_of_event(self):
+        other_game = Game.objects.create(name="Doom")
+        self.assertIsNone(add_vote(self.event, other_game.id, "Alice"))
+        self.assertFalse(Vote.objects.exists())
+
+    def test_removes_own_vote_once(self):
+        vote = add_vote(self.event, self.game.id, "Alice")
+        self.assertIsNone(remove_vote(self.event, vote.id, "Bob"))
+        self.assertEqual(remove_vote(self.event, vote.id, "Alice").game, self.game)
+        self.assertIsNone(remove_vote(self.event, vote.id, "Alice"))
+        self.assertFalse(Vote.objects.exists())
+
+    def test_superlikes_one_game_per_user(self):
+        other_game = _add_game(self.event, "Doom")
+        add_vote(self.event, self.game.id, "Alice")
+        add_vote(self.event, other_game.id, "Alice")
+
+        vote = superlike_vote(self.event, self.game.id, "Alice")
+        self.assertTrue(vote.is_superlike)
+        self.assertIsNone(superlike_vote(self.event, self.game.id, "Alice"))
+        self.assertIsNone(superlike_vote(self.event, other_game.id, "Alice"))
+
+        self.assertEqual(unsuperlike_vote(self.event, vote.id, "Alice"), vote)
+        self.assertIsNone(unsuperlike_vote(self.event, vote.id, "Alice"))
+        self.assertTrue(superlike_vote(self.event, other_game.id, "Alice"))
+
+    def test_can_only_superlike_own_votes(self):
+        self.assertIsNone(superlike_vote(self.event, self.game.id, "Alice"))
+        vote = add_vote(self.event, self.game.id, "Alice")
+        superlike_vote(self.event, self.game.id, "Alice")
+        self.assertIsNone(unsuperlike_vote(self.event, vote.id, "Bob"))
+
+    def test_database_rejects_second_superlike(self):
+        other_game = _add_game(self.event, "Doom")
+        Vote.objects.create(
+            event=self.event, game=self.game, username="Alice", is_superlike=True
+        )
+        with self.assertRaises(IntegrityError):
+            Vote.objects.create(
+                event=self.event, game=other_game, username="Alice", is_superlike=True
+            )
+
+
+class HtmxVotingTestCase(TransactionTestCase):
+    """Responses need the versions bumped when votes are committed."""
+
+    def setUp(self):
+        self.event = Event.objects.create(name="LAN")
+        self.game = _add_game(self.event, "Quake")
+        session = self.client.session
+        session["username"] = "Alice"
+        session.save()
+
+    def test_voting_with_htmx_returns_card_and_changed_ranks(self):
+        tetris = _add_game(self.event, "Tetris", usernames=["Bob"])
+        doom = _add_game(self.event, "Doom")
+        pong = _add_game(self.event, "Pong", usernames=["Alice"])
+        add_vote(self.event, self.game.id, "Bob")
+        url = reverse("event-vote-game", kwargs={"uuid": self.event.uuid})
+
+        # Quake moves ahead of Tetris and Pong, Doom moves down as well.
+        response = self.client.post(
+            url, {"game_id": self.game.id}, HTTP_HX_REQUEST="true"
+        )
+        self.assertContains(response, f'id="game-{self.game.id}"')
+        self.assertContains(response, 'name="superlike_game_id"')
+        for game in (tetris, doom, pong):
+            self.assertNotContains(response, f'id="game-{game.id}"')
+            self.assertContains(response, f'id="game-rank-{game.id}"')
+        # Only the one in its card.
+        self.assertContains(response, f'id="game-rank-{self.game.id}"', count=1)
+        # The card, three rank labels and the order.
+        self.assertContains(response, 'hx-swap-oob="true"', count=5)
+
+        response = self.client.post(url, {"superlike_game_id": self.game.id})
+        self.assertRedirects(
+            response,
+            reverse("event-detail", kwargs={"uuid": self.event.uuid})
+            + f"?game={self.game.id}",
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(
+            list(
+                Activity.objects.filter(actor="Alice")
+                .values_list("kind", flat=True)
+                .order_by("id")
+            ),
+            [Activity.VOTE, Activity.SUPERLIKE],
+        )
+
+    def test_voting_with_htmx_costs_the_same_for_many_ties(self):
+        games = [
+            _add_game(self.event, f"Game {i:02}", usernames=["Bob"]) for i in range(30)
+        ]
+        add_vote(self.event, self.game.id, "Alice")
+        url = reverse("event-vote-game", kwargs={"uuid": self.event.uuid})
+        self.client.get(reverse("event-detail", kwargs={"uuid": self.event.uuid}))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                url, {"game_id": games[-1].id}, HTTP_HX_REQUEST="true"
+            )
+        self.assertLessEqual(
+            len(queries), settings.INSTRUMENTATION["QUERY_BUDGETS"]["event-vote-game"]
+        )
+        # One card, the rank labels of all 31 Games and the new order.
+        self.assertContains(response, 'class="fade-in"', count=1)
+        self.assertContains(response, 'id="game-rank-', count=31)
+        self.assertContains(response, f'data-game-ids="{games[-1].id},{games[0].id},')
+        self.assertLess(len(response.content), 16 * 1024)
+
+    def test_voting_as_new_participant_reloads_everything(self):
+        _add_game(self.event, "Tetris", usernames=["Bob"], superlike_usernames=["Bob"])
+        url = reverse("event-vote-game", kwargs={"uuid": self.event.uuid})
+
+        # Alice halves the weight of Bob's superlike and is a new member.
+        response = self.client.post(
+            url, {"game_id": self.game.id}, HTTP_HX_REQUEST="true"
+        )
+        self.assertEqual(response["HX-Trigger"], "event-changed")
+        self.assertEqual(response.content, b"")
+
+        response = self.client.post(
+            url, {"superlike_game_id": self.game.id}, HTTP_HX_REQUEST="true"
+        )
+        self.assertNotIn("HX-Trigger", response)
+        self.assertContains(response, f'id="game-{self.game.id}"')
+
+
+class EventCountersTestCase(TestCase):
+    def setUp(self):
+        self.event = Event.objects.create(name="LAN")
+
+    def _assert_counts(self, num_votes, num_participants, num_comments):
+        self.event.refresh_from_db()
+        self.assertEqual(
+            (
+                self.event.num_votes,
+                self.event.num_participants,
+                self.event.num_comments,
+            ),
+            (num_votes, num_participants, num_comments),
+        )
+
+    def test_counts_votes_and_participants(self):
+        quake = _add_game(self.event, "Quake", usernames=["Alice", "bob"])
+        doom = _add_game(self.event, "Doom", usernames=["Alice"])
+        add_vote(self.event, doom.id, "Carol")
+        add_vote(self.event, doom.id, "Carol")
+        self._assert_counts(4, 3, 0)
+        self.assertEqual(self.event.usernames, ["Alice", "bob", "Carol"])
+
+        Vote.objects.filter(username="Alice", game=quake).delete()
+        self._assert_counts(3, 3, 0)
+        remove_vote(self.event, Vote.objects.get(username="Carol").id, "Carol")
+        self._assert_counts(2, 2, 0)
+        doom.delete()
+        self._assert_counts(1, 1, 0)
+
+    def test_counts_visible_general_comments(self):
+        game = _add_game(self.event, "Quake")
+        comment = Comment.objects.create(event=self.event, username="Alice", text="!")
+        Comment.objects.create(event=self.event, game=game, username="Bob", text="!")
+        self._assert_counts(0, 0, 1)
+
+        comment.softdeleted = True
+        comment.save(update_fields=["softdeleted"])
+        self._assert_counts(0, 0, 0)
+
+    @mock.patch("builtins.print")
+    def test_recounts_events(self, print_):
+        _add_game(self.event, "Quake", usernames=["Alice"])
+        Comment.objects.create(event=self.event, username="Alice", text="!")
+        Event.objects.update(num_votes=0, num_participants=5, num_comments=0)
+        EventParticipant.objects.all().delete()
+
+        call_command("recount_events")
+        self._assert_counts(1, 1, 1)
+        self.assertEqual(self.event.usernames, ["Alice"])
+        print_.assert_called_with("Recounted 1 events, fixed 1")
+
+        call_command("recount_events", str(self.event.uuid))
+        print_.assert_called_with("Recounted 1 events, fixed 0")
+
+
+class CommentThreadTestCase(TestCase):
+    def setUp(self):
+        self.event = Event.objects.create(name="LAN")
+
+    def _comment(self, username, text="!", **kwargs):
+        return Comment.objects.create(
+            event=self.event, username=username, text=text, **kwargs
+        )
+
+    def test_aligns_new_comments_like_a_chat(self):
+        for username in ["Alice", "Alice", "Bob", "Carol", "Carol", "Alice"]:
+            self._comment(username)
+        self._comment("Bob", softdeleted=True)
+        self._comment("Bob")
+        self.assertEqual(
+            list(
+                Comment.objects.filter(softdeleted=False)
+                .order_by("id")
+                .values_list("alignment", flat=True)
+            ),
+            ["left", "left", "right", "left", "left", "right", "left"],
+        )
+
+    def test_aligns_first_comment_left(self):
+        comments = [
+            Comment(username="Alice"),
+            Comment(username="Bob"),
+            Comment(username="Alice", alignment="right"),
+        ]
+        augment_comment_alignment(comments)
+        self.assertEqual(
+            [comment.alignment for comment in comments], ["left", "right", "left"]
+        )
+
+    def test_pages_from_newest_to_oldest(self):
+        comments = [self._comment("Alice", text=str(i)) for i in range(7)]
+        # Same created_at, the id decides.
+        Comment.objects.filter(id__in=[comments[2].id, comments[3].id]).update(
+            created_at=comments[2].created_at
+        )
+
+        texts = []
+        before = None
+        while True:
+            page = get_comment_page(self.event, before=before, per_page=3)
+            texts.insert(0, [comment.text for comment in page.comments])
+            before = page.older_cursor
+            if before is None:
+                break
+        self.assertEqual(texts, [["0"], ["1", "2", "3"], ["4", "5", "6"]])
+
+    def test_loads_older_comments(self):
+        for i in range(COMMENTS_PER_PAGE + 1):
+            self._comment("Alice", text=f"Comment {i}")
+        session = self.client.session
+        session["username"] = "Alice"
+        session.save()
+
+        response = self.client.get(
+            reverse("event-add-comment", kwargs={"uuid": self.event.uuid})
+        )
+        self.assertNotContains(response, "Comment 0<")
+        self.assertContains(response, f"Comment {COMMENTS_PER_PAGE}<")
+        older_cursor = response.context["comment_page"].older_cursor
+
+        url = reverse("event-older-comments", kwargs={"uuid": self.event.uuid})
+        response = self.client.get(url, {"before": older_cursor})
+        self.assertContains(response, "Comment 0<")
+        self.assertNotContains(response, "Comment 1<")
+        self.assertNotContains(response, "Load older")
+
+        response = self.client.get(url, {"before": "nonsense"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_summarizes_all_threads_in_two_queries(self):
+        halo = _add_game(self.event, "Halo")
+        doom = _add_game(self.event, "Doom")
+        for i in range(5):
+            self._comment("Alice", text=f"Halo {i}", game=halo)
+        self._comment("Bob", text="Hidden", game=halo, softdeleted=True)
+        self._comment("Bob", text="Doom 0", game=doom)
+        self._comment("Carol", text="General 0")
+
+        with self.assertNumQueries(2):
+            summaries = get_comment_summaries(self.event)
+            texts = {
+                game_id: [comment.text for comment in summary.latest_comments]
+                for game_id, summary in summaries.items()
+            }
+        self.assertEqual(summaries[halo.id].num_comments, 5)
+        self.assertEqual(texts[halo.id], ["Halo 2", "Halo 3", "Halo 4"])
+        self.assertEqual(summaries[doom.id].num_comments, 1)
+        self.assertEqual(texts[None], ["General 0"])
+
+        with self.assertNumQueries(1):
+            summaries = get_comment_summaries(self.event, [doom.id], num_latest=0)
+        self.assertEqual(summaries[doom.id].num_comments, 1)
+        self.assertEqual(summaries[doom.id].latest_comments, [])
+        self.assertEqual(summaries[halo.id].num_comments, 0)
+
+        session = self.client.session
+        session["username"] = "Alice"
+        session.save()
+        response = self.client.get(
+            reverse("event-detail", kwargs={"uuid": self.event.uuid})
+        )
+        self.assertRegex(response.content.decode(), r"5\s+Comments")
+        self.assertContains(response, 'title="Alice: Halo 2&#10;Alice: Halo 3')
+
+
+class CommentHtmlTestCase(TestCase):
+    def setUp(self):
+        self.event = Event.objects.create(name="LAN")
+
+    def test_stores_html_on_save(self):
+        comment = Comment.objects.create(
+            event=self.event, username="Alice", text="<script>x</script> a.com"
+        )
+        comment.refresh_from_db()
+        self.assertIn("&lt;script&gt;", comment.text_html)
+        self.assertIn('<a href="http://a.com"', comment.text_html)
+
+        comment.text = "Changed"
+        comment.save(update_fields=["text"])
+        comment.refresh_from_db()
+        self.assertEqual(comment.text_html, "Changed")
+
+    @mock.patch("builtins.print")
+    def test_backfills_html(self, _):
+        comment = Comment.objects.create(event=self.event, username="Alice", text="<div>")
+        Comment.objects.update(text_html="")
+        comment.refresh_from_db()
+        self.assertEqual(comment.text_as_html, "&lt;div&gt;")
+
+        with self.assertNumQueries(3):
+            call_command("backfill_comment_html")
+        self.assertEqual(Comment.objects.get().text_html, "&lt;div&gt;")
+
+
+@skipUnless(connection.vendor == "postgresql", "Checks PostgreSQL query plans")
+class PostgresQueryPlanTestCase(TestCase):
+    def test_searches_games_by_trigram_index(self):
+        with connection.cursor() as cursor:
+            # The table is too small for the planner to prefer the index.
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = Game.objects.filter(name__icontains="quake").explain()
+        self.assertIn("core_game_name_trgm", plan)
+
+
+@skipUnless(connection.vendor == "sqlite", "Checks SQLite settings")
+class SqliteTuningTestCase(TestCase):
+    def test_applies_pragmas_to_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(
+                cursor.fetchone()[0], settings.SQLITE_PRAGMAS["busy_timeout"]
+            )
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_load_test_votes_without_locking_errors(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rates = run_load(
+                Path(tmp_dir) / "load.sqlite3",
+                settings.SQLITE_PRAGMAS,
+                writers=4,
+                readers=2,
+                seconds=0.2,
+            )
+        self.assertGreater(rates["votes"], 0)
+        self.assertGreater(rates["reads"], 0)
+        self.assertEqual(rates["locked"], 0)
+
+
+class GameSearchTestCase(TestCase):
+    def setUp(self):
+        for name in [
+            "Half-Life 2",
+            "Half-Life",
+            "Counter-Strike 2",
+            "Life is Strange",
+            "The Life of Brian",
+            "Portal 2",
+        ]:
+            Game.objects.create(name=name)
+
+    def _search(self, search_text):
+        return [game.name for game in search_games(search_text)]
+
+    def test_ranks_prefix_and_word_matches_first(self):
+        self.assertEqual(
+            self._search("life"),
+            ["Life is Strange", "The Life of Brian", "Half-Life", "Half-Life 2"],
+        )
+
+    def test_ranks_games_from_previous_events_higher(self):
+        event = Event.objects.create(name="LAN")
+        game = Game.objects.get(name="Half-Life 2")
+        EventGame.objects.create(event=event, game=game)
+        self.assertEqual(self._search("half")[0], "Half-Life 2")
+
+    def test_matches_all_words_including_short_ones(self):
+        self.assertEqual(self._search("strike 2"), ["Counter-Strike 2"])
+        self.assertEqual(
+            self._search("2"), ["Portal 2", "Half-Life 2", "Counter-Strike 2"]
+        )
+
+    def test_index_follows_renames_and_deletes(self):
+        game = Game.objects.get(name="Portal 2")
+        game.name = "Portal Reloaded"
+        game.save()
+        self.assertEqual(self._search("portal"), ["Portal Reloaded"])
+        game.delete()
+        self.assertEqual(self._search("portal"), [])
+
+
+class GameNameIndexTestCase(TestCase):
+    def setUp(self):
+        self.index = GameNameIndex()
+        self.index.add(
+            [(1, "Half-Life 2"), (2, "Counter-Strike"), (3, "Hades"), (4, "Pokémon")]
+        )
+
+    def test_finds_name_and_word_prefixes(self):
+        self.assertEqual(self.index.lookup("ha"), [3, 1])
+        self.assertEqual(self.index.lookup("life"), [1])
+        self.assertEqual(self.index.lookup("pokem"), [4])
+
+    def test_tolerates_one_typo(self):
+        self.assertEqual(self.index.lookup("conter"), [2])
+        self.assertEqual(self.index.lookup("hlaf"), [1])
+
+    def test_adds_games_incrementally(self):
+        self.index.add([(5, "Half-Life: Alyx")])
+        self.assertEqual(self.index.lookup("half life"), [1, 5])
+        self.assertEqual(self.index.max_game_id, 5)
+
+    @override_settings(AUTOCOMPLETE={"MAX_NAME_LENGTH": 64, "REFRESH_SECONDS": 0})
+    def test_rebuilds_shared_index_after_renames(self):
+        game = Game.objects.create(appid=10, name="Portal")
+        Game.objects.create(appid=20, name="Quake")
+        with mock.patch("gamedoodle.core.autocomplete._index", None):
+            self.assertEqual(suggest_games("portal"), [game])
+
+            upsert_games(
+                [
+                    {"appid": 10, "name": "Portal Reloaded"},
+                    {"appid": 30, "name": "Portal 2"},
+                ],
+                batch_size=10,
+            )
+            new_game = Game.objects.get(appid=30)
+            self.assertEqual(suggest_games("reloaded"), [game])
+            self.assertEqual(suggest_games("portal"), [new_game, game])
+
+
+def _app_list_response(apps, have_more_results):
+    response = mock.Mock()
+    response.json.return_value = {
+        "response": {
+            "apps": apps,
+            "have_more_results": have_more_results,
+            "last_appid": apps[-1]["appid"],
+        }
+    }
+    return response
+
+
+@mock.patch("requests.Session.get")
+class FetchAllSteamGamesTestCase(TestCase):
+    def _fetch(self):
+        with mock.patch("builtins.print"):
+            call_command("fetch_all_steam_games", batch_size=2)
+
+    def test_imports_pages_and_renames_existing_games(self, get):
+        renamed = Game.objects.create(appid=10, name="Old name")
+        unchanged = Game.objects.create(appid=30, name="C")
+        get.side_effect = [
+            _app_list_response(
+                [{"appid": 10, "name": "New name"}, {"appid": 20, "name": "B"}],
+                have_more_results=True,
+            ),
+            _app_list_response([{"appid": 30, "name": "C"}], have_more_results=False),
+        ]
+        self._fetch()
+
+        self.assertEqual(
+            list(Game.objects.order_by("appid").values_list("appid", "name")),
+            [(10, "New name"), (20, "B"), (30, "C")],
+        )
+        self.assertGreater(
+            Game.objects.get(id=renamed.id).modified_at, renamed.modified_at
+        )
+        self.assertEqual(
+            Game.objects.get(id=unchanged.id).modified_at, unchanged.modified_at
+        )
+        self.assertEqual(Checkpoint.get_value("fetch_all_steam_games.last_appid"), "")
+
+    def test_continues_after_last_imported_page(self, get):
+        get.side_effect = [
+            _app_list_response([{"appid": 10, "name": "A"}], have_more_results=True),
+            requests.ConnectionError(),
+        ]
+        with self.assertRaises(requests.ConnectionError):
+            self._fetch()
+        self.assertEqual(
+            Checkpoint.get_value("fetch_all_steam_games.last_appid"), "10"
+        )
+
+        get.side_effect = [
+            _app_list_response([{"appid": 20, "name": "B"}], have_more_results=False),
+        ]
+        self._fetch()
+        self.assertTrue(get.call_args.args[0].endswith("&last_appid=10"))
+        self.assertEqual(Game.objects.count(), 2)
+
+
+class StubSteamServer:
+    """Local HTTP server answering like the Steam appdetails API."""
+
+    def __init__(self, app_details, num_failures=0):
+        self.app_details = app_details
+        self.num_failures = num_failures
+        self.requested_appids = []
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                appid = self.path.rsplit("=", 1)[-1]
+                stub.requested_appids.append(int(appid))
+                if stub.num_failures > 0:
+                    stub.num_failures -= 1
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+
+                data = stub.app_details.get(int(appid))
+                payload = {appid: {"success": data is not None}}
+                if data is not None:
+                    payload[appid]["data"] = data
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.01,), daemon=True
+        ).start()
+        host, port = self.server.server_address
+        self.settings = override_settings(
+            STEAM_API_BASE_URL_APPDETAILS=(
+                f"http://{host}:{port}/api/appdetails/?appids="
+            )
+        )
+        self.settings.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.settings.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(STEAM_API_BACKOFF_FACTOR=0)
+class SteamTestCase(TestCase):
+    def setUp(self):
+        # Create a new session with the settings from above.
+        session_patcher = mock.patch("gamedoodle.core.steam._session", None)
+        session_patcher.start()
+        self.addCleanup(session_patcher.stop)
+
+    app_details = {
+        10: {
+            "is_free": True,
+            "screenshots": [{"path_thumbnail": "https://example.com/10.jpg"}],
+        },
+        20: {"is_free": False},
+    }
+
+    def test_enrich_game_caches_app_details(self):
+        game = Game.objects.create(appid=10, name="A")
+        with StubSteamServer(self.app_details) as steam:
+            enrich_game(game)
+            enrich_game(Game.objects.get(id=game.id))
+
+        game.refresh_from_db()
+        self.assertTrue(game.is_free)
+        self.assertEqual(game.image_url, "https://example.com/10.jpg")
+        self.assertEqual(game.store_url, "https://store.steampowered.com/app/10")
+        self.assertEqual(steam.requested_appids, [10])
+
+    def test_enrich_game_retries_and_raises_for_unreachable_steam(self):
+        game = Game.objects.create(appid=10, name="A")
+        with StubSteamServer(self.app_details, num_failures=1) as steam:
+            enrich_game(game)
+        self.assertEqual(steam.requested_appids, [10, 10])
+        self.assertTrue(game.is_free)
+
+        game = Game.objects.create(appid=20, name="B")
+        with StubSteamServer(self.app_details, num_failures=10):
+            with self.assertRaises(requests.RequestException):
+                enrich_game(game)
+        self.assertFalse(SteamAppDetails.objects.filter(appid=20).exists())
+
+    def test_prefetch_fetches_games_of_writable_events(self):
+        writable_event = Event.objects.create(name="LAN")
+        read_only_event = Event.objects.create(name="Old LAN", read_only=True)
+        for appid, event in [
+            (10, writable_event),
+            (20, writable_event),
+            (30, read_only_event),
+        ]:
+            game = Game.objects.create(appid=appid, name=str(appid))
+            EventGame.objects.create(event=event, game=game)
+
+        with StubSteamServer(self.app_details) as steam:
+            with mock.patch("builtins.print"):
+                call_command("prefetch_steam_app_details", workers=2)
+        self.assertEqual(sorted(steam.requested_appids), [10, 20])
+        self.assertEqual(SteamAppDetails.objects.count(), 2)
+        self.assertTrue(Game.objects.get(appid=10).is_free)
+
+
+@mock.patch("builtins.print")
+@mock.patch("gamedoodle.core.mailing.GmailMailer.send")
+@mock.patch("gamedoodle.core.digests.SAFETY_LAG", timedelta(0))
+class SendEmailNotificationsTestCase(TestCase):
+    def _login(self, username):
+        session = self.client.session
+        session["username"] = username
+        session.save()
+
+    def _add_activity(self, event, emails, game_name, comment_text):
+        for email in emails:
+            EventSubscription.objects.create(event=event, email=email, active=True)
+        game = Game.objects.create(name=game_name)
+        self._login("Alice")
+        self.client.post(
+            reverse("event-add-matching-game", kwargs={"uuid": event.uuid}),
+            {"game_id": game.id},
+        )
+        self._login("Bob")
+        self.client.post(
+            reverse("event-add-comment", kwargs={"uuid": event.uuid})
+            + f"?game={game.id}",
+            {"new-comment": comment_text},
+        )
+        return game
+
+    def test_sends_one_digest_per_event_to_its_subscribers(self, send_email, _):
+        lan = Event.objects.create(name="LAN")
+        party = Event.objects.create(name="Party")
+        self._add_activity(lan, ["alice@example.com", "bob@example.com"], "Quake", "Yes!")
+        self._add_activity(party, ["carol@example.com"], "Doom", "Pizza?")
+        EventSubscription.objects.create(event=party, email="dave@example.com")
+        call_command("send_email_notifications")
+
+        emails = {
+            call.kwargs["recipient"]: call.kwargs for call in send_email.call_args_list
+        }
+        self.assertEqual(
+            sorted(emails), ["alice@example.com", "bob@example.com", "carol@example.com"]
+        )
+        lan_body = emails["alice@example.com"]["body"]
+        self.assertIn("- Alice added Quake", lan_body)
+        self.assertIn("- Alice voted for Quake", lan_body)
+        self.assertIn("- Bob commented on Quake: Yes!", lan_body)
+        self.assertNotIn("Pizza", lan_body)
+        self.assertIn(str(lan.eventsubscription_set.first().uuid), lan_body)
+        party_body = emails["carol@example.com"]["body"]
+        self.assertIn("- Bob commented on Doom: Pizza?", party_body)
+        self.assertNotIn("Quake", party_body)
+
+    def test_waits_for_recent_activity_to_be_committed(self, send_email, _):
+        call_command("send_email_notifications")  # Sets the checkpoints.
+        lan = Event.objects.create(name="LAN")
+        self._add_activity(lan, ["alice@example.com"], "Quake", "Yes!")
+        with mock.patch("gamedoodle.core.digests.SAFETY_LAG", timedelta(minutes=1)):
+            call_command("send_email_notifications")
+            self.assertEqual(send_email.call_count, 0)
+
+            Activity.objects.update(created_at=timezone.now() - timedelta(minutes=2))
+            call_command("send_email_notifications")
+        self.assertEqual(send_email.call_count, 1)
+        self.assertIn(
+            "- Bob commented on Quake: Yes!", send_email.call_args.kwargs["body"]
+        )
+
+    def test_query_count_does_not_grow_with_activity(self, send_email, _):
+        call_command("send_email_notifications")  # Sets the checkpoints.
+        lan = Event.objects.create(name="LAN")
+        self._add_activity(lan, ["alice@example.com"], "Quake", "Yes!")
+        with CaptureQueriesContext(connection) as queries:
+            call_command("send_email_notifications")
+        num_queries = len(queries)
+
+        for i in range(3):
+            event = Event.objects.create(name=f"LAN {i}")
+            self._add_activity(event, ["bob@example.com"], f"Doom {i}", "Yes!")
+        # Only one more to record each further Event as sent.
+        with self.assertNumQueries(num_queries + 2):
+            call_command("send_email_notifications")
+        self.assertEqual(send_email.call_count, 4)
+
+    def test_continues_after_last_run(self, send_email, _):
+        lan = Event.objects.create(name="LAN")
+        game = self._add_activity(lan, ["alice@example.com"], "Quake", "Yes!")
+        call_command("send_email_notifications")
+
+        send_email.reset_mock()
+        call_command("send_email_notifications")
+        send_email.assert_not_called()
+
+        self._login("Carol")
+        self.client.post(
+            reverse("event-vote-game", kwargs={"uuid": lan.uuid}),
+            {"game_id": game.id},
+        )
+        call_command("send_email_notifications")
+        body = send_email.call_args.kwargs["body"]
+        self.assertIn("Carol voted for Quake", body)
+        self.assertNotIn("Alice", body)
+
+    def test_resends_only_missing_digests_after_failure(self, send_email, _):
+        lan = Event.objects.create(name="LAN")
+        party = Event.objects.create(name="Party")
+        self._add_activity(lan, ["alice@example.com"], "Quake", "Yes!")
+        self._add_activity(party, ["carol@example.com"], "Doom", "Pizza?")
+
+        def fail_for_carol(**kwargs):
+            if kwargs["recipient"] == "carol@example.com":
+                raise smtplib.SMTPServerDisconnected()
+
+        send_email.side_effect = fail_for_carol
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            call_command("send_email_notifications")
+
+        send_email.reset_mock(side_effect=True)
+        call_command("send_email_notifications")
+        self.assertEqual(
+            [call.kwargs["recipient"] for call in send_email.call_args_list],
+            ["carol@example.com"],
+        )
+        self.assertFalse(
+            Checkpoint.objects.filter(
+                name__startswith=f"{LAST_ACTIVITY_ID_CHECKPOINT}.event."
+            ).exists()
+        )
+
+        call_command("send_email_notifications")
+        self.assertEqual(send_email.call_count, 1)
+
+    def test_backfills_activities_without_checkpoint(self, send_email, _):
+        event = Event.objects.create(name="LAN")
+        _add_game(event, "Quake")
+        Checkpoint.objects.filter(name=ACTIVITIES_STARTED_AT_CHECKPOINT).delete()
+        with self.assertRaisesMessage(CommandError, "--before"):
+            call_command("backfill_activities")
+
+        with mock.patch("builtins.print"):
+            call_command("backfill_activities", before=timezone.now().isoformat())
+        self.assertEqual(
+            list(Activity.objects.values_list("kind", flat=True)),
+            [Activity.ADD_GAME],
+        )
+
+    def test_backfills_activities_from_before_the_first_one(self, send_email, _):
+        event = Event.objects.create(name="LAN")
+        with self.captureOnCommitCallbacks(execute=True):
+            game = _add_game(event, "Quake", usernames=["Alice", "Bob"])
+            Vote.objects.filter(username="Bob").delete()
+            Comment.objects.create(event=event, game=game, username="Carol", text="Hi")
+        Checkpoint.set_value(ACTIVITIES_STARTED_AT_CHECKPOINT, timezone.now().isoformat())
+        self._add_activity(event, ["alice@example.com"], "Doom", "Yes!")
+
+        call_command("backfill_activities")
+        call_command("backfill_activities")
+        self.assertEqual(
+            sorted(
+                Activity.objects.filter(payload__has_key="backfilled").values_list(
+                    "kind", "actor"
+                )
+            ),
+            [
+                (Activity.ADD_GAME, "Alice"),
+                (Activity.COMMENT, "Carol"),
+                (Activity.UNVOTE, "Bob"),
+                (Activity.VOTE, "Alice"),
+                (Activity.VOTE, "Bob"),
+            ],
+        )
+
+        # Backfilled activities are not news anymore.
+        call_command("send_email_notifications")
+        body = send_email.call_args.kwargs["body"]
+        self.assertIn("Doom", body)
+        self.assertNotIn("Quake", body)
+
+
+class StubSmtpServer:
+    """Local SMTP server without TLS, collecting the messages it receives."""
+
+    def __init__(self):
+        self.messages = []
+        self.num_connections = 0
+        self.num_logins = 0
+        self.disconnect_next_message = False
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                stub.num_connections += 1
+                self.reply("220 localhost")
+                while line := self.rfile.readline().decode().strip():
+                    command = line.split(" ", 1)[0].upper()
+                    if command == "EHLO":
+                        self.reply("250-localhost")
+                        self.reply("250 AUTH PLAIN")
+                    elif command == "AUTH":
+                        stub.num_logins += 1
+                        self.reply("235 Authenticated")
+                    elif command == "MAIL" and stub.disconnect_next_message:
+                        stub.disconnect_next_message = False
+                        return
+                    elif command == "DATA":
+                        self.reply("354 Go ahead")
+                        lines = []
+                        while (data_line := self.rfile.readline()) != b".\r\n":
+                            lines.append(data_line.decode())
+                        stub.messages.append(message_from_string("".join(lines)))
+                        self.reply("250 Queued")
+                    elif command == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("250 OK")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.01,), daemon=True
+        ).start()
+        host, port = self.server.server_address
+        self.settings = override_settings(
+            EMAIL_NOTIFICATIONS={
+                **settings.EMAIL_NOTIFICATIONS,
+                "GMAIL_SMTP_SERVER": host,
+                "GMAIL_SMTP_PORT": port,
+                "GMAIL_USE_TLS": False,
+            }
+        )
+        self.settings.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.settings.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class GmailMailerTestCase(TestCase):
+    def test_sends_batch_over_one_connection(self):
+        with StubSmtpServer() as smtp:
+            with GmailMailer() as mailer:
+                for i in range(3):
+                    mailer.send(
+                        recipient=f"user{i}@example.com", subject="Hi", body="Hello"
+                    )
+
+        self.assertEqual(smtp.num_connections, 1)
+        self.assertEqual(smtp.num_logins, 1)
+        self.assertEqual(
+            [message["To"] for message in smtp.messages],
+            ["user0@example.com", "user1@example.com", "user2@example.com"],
+        )
+        self.assertEqual(SentMail.objects.count(), 3)
+
+    def test_reconnects_when_server_closed_connection(self):
+        with StubSmtpServer() as smtp:
+            with GmailMailer() as mailer:
+                mailer.send(recipient="alice@example.com", subject="Hi", body="1")
+                smtp.disconnect_next_message = True
+                mailer.send(recipient="alice@example.com", subject="Hi", body="2")
+
+        self.assertEqual(smtp.num_connections, 2)
+        self.assertEqual(len(smtp.messages), 2)
+
+
+@mock.patch("builtins.print")
+class CompactHistoryTestCase(TestCase):
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        self.archive_dir = archive_dir.name
+        settings_override = override_settings(
+            RETENTION={
+                "POLICIES": {
+                    "SentMail": {
+                        "MAX_AGE_DAYS": 30,
+                        "MAX_ROWS": 5,
+                        "KEEP_LAST_PER_RECIPIENT": 1,
+                    },
+                    "CRUDEvent": {"MAX_AGE_DAYS": 30, "MAX_ROWS": 100},
+                    "Activity": {"MAX_AGE_DAYS": 30, "MAX_ROWS": 100},
+                },
+                "ARCHIVE_DIR": self.archive_dir,
+                "BATCH_SIZE": 2,
+            }
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _send_mail(self, recipient, days_ago=0):
+        mail = SentMail.objects.create(recipient=recipient, subject=recipient)
+        created_at = timezone.now() - timedelta(days=days_ago)
+        SentMail.objects.filter(id=mail.id).update(created_at=created_at)
+        return mail
+
+    def _read_archive(self, path):
+        with gzip.open(path, "rt") as archive_file:
+            return [json.loads(line) for line in archive_file]
+
+    def test_archives_and_deletes_expired_sent_mails(self, _):
+        old_alice = self._send_mail("alice@example.com", days_ago=40)
+        latest_bob = self._send_mail("bob@example.com", days_ago=40)
+        recent = [self._send_mail("alice@example.com") for _ in range(6)]
+        call_command("compact_history")
+
+        # Beyond 5 rows, but the latest one of Bob is kept.
+        self.assertQuerysetEqual(
+            SentMail.objects.order_by("id"),
+            [latest_bob] + recent[1:],
+        )
+        (archive_path,) = Path(self.archive_dir).glob("core.SentMail-*.jsonl.gz")
+        self.assertEqual(
+            [row["id"] for row in self._read_archive(archive_path)],
+            [old_alice.id, recent[0].id],
+        )
+
+    def test_archives_rows_again_if_delete_fails(self, _):
+        mails = [self._send_mail("alice@example.com", days_ago=40) for _ in range(2)]
+        with mock.patch.object(QuerySet, "delete", side_effect=DatabaseError("locked")):
+            with self.assertRaises(DatabaseError):
+                call_command("compact_history")
+        self.assertEqual(SentMail.objects.count(), 2)
+
+        call_command("compact_history")
+        (archive_path,) = Path(self.archive_dir).glob("core.SentMail-*.jsonl.gz")
+        self.assertEqual(
+            [row["id"] for row in self._read_archive(archive_path)],
+            [mails[0].id, mails[0].id],
+        )
+        self.assertQuerysetEqual(SentMail.objects.all(), [mails[1]])
+
+    def test_keeps_activities_needed_for_next_digest(self, _):
+        event = Event.objects.create(name="LAN")
+        sent, pending = [
+            Activity.objects.create(
+                event=event,
+                kind=Activity.VOTE,
+                created_at=timezone.now() - timedelta(days=400),
+            )
+            for _ in range(2)
+        ]
+        Checkpoint.set_value(LAST_ACTIVITY_ID_CHECKPOINT, str(sent.id))
+        call_command("compact_history", no_archive=True)
+
+        self.assertQuerysetEqual(Activity.objects.all(), [pending])
+
+
+_num_flaky_task_failures = 0
+
+
+@task
+def flaky_task(num_failures: int):
+    global _num_flaky_task_failures
+    if _num_flaky_task_failures < num_failures:
+        _num_flaky_task_failures += 1
+        raise RuntimeError("Not yet")
+
+
+@override_settings(STEAM_API_BACKOFF_FACTOR=0, STEAM_API_RETRIES=0)
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        global _num_flaky_task_failures
+        _num_flaky_task_failures = 0
+        session_patcher = mock.patch("gamedoodle.core.steam._session", None)
+        session_patcher.start()
+        self.addCleanup(session_patcher.stop)
+
+    def _run_due_jobs(self):
+        call_command("run_worker", once=True, concurrency=1)
+        # Make retries due right away.
+        Job.objects.filter(status=Job.PENDING).update(run_after="2000-01-01T00:00Z")
+
+    def test_adding_game_enriches_it_in_the_background(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            event = Event.objects.create(name="LAN")
+        game = Game.objects.create(appid=10, name="A")
+        session = self.client.session
+        session["username"] = "Alice"
+        session.save()
+
+        with StubSteamServer(SteamTestCase.app_details) as steam:
+            url = reverse("event-add-matching-game", kwargs={"uuid": event.uuid})
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(url, {"game_id": game.id})
+            self.assertEqual(steam.requested_appids, [])
+            card_url = reverse(
+                "event-game-card", kwargs={"uuid": event.uuid, "game_id": game.id}
+            )
+            response = self.client.get(card_url)
+            self.assertContains(response, f"{settings.STEAM_STORE_PAGE_BASE_URL}10")
+            self.assertNotContains(response, ">free<")
+
+            # Without redis the card polls until the details are there.
+            event_url = reverse("event-detail", kwargs={"uuid": event.uuid})
+            self.assertContains(self.client.get(event_url), f"{card_url}?attempt=1")
+            response = self.client.get(card_url, {"attempt": 1})
+            self.assertContains(response, f"{card_url}?attempt=2")
+            with override_settings(
+                LIVE_UPDATES={**settings.LIVE_UPDATES, "POLL_ATTEMPTS": 2}
+            ):
+                response = self.client.get(card_url, {"attempt": 2})
+            self.assertNotContains(response, "hx-get")
+
+            # Steam is down at first, the Job is retried.
+            steam.num_failures = 1
+            with self.assertLogs("gamedoodle.core.jobs", "WARNING"):
+                self._run_due_jobs()
+            self.assertEqual(Job.objects.get().status, Job.PENDING)
+            with self.captureOnCommitCallbacks(execute=True):
+                self._run_due_jobs()
+
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 2)
+        game.refresh_from_db()
+        self.assertTrue(game.is_free)
+        response = self.client.get(card_url, {"attempt": 1})
+        self.assertContains(response, ">free<")
+        self.assertNotContains(response, "hx-get")
+
+    def test_subscribing_sends_confirmation_in_the_background(self):
+        event = Event.objects.create(name="LAN")
+        session = self.client.session
+        session["username"] = "Alice"
+        session.save()
+        url = reverse("event-notifications-subscribe", kwargs={"uuid": event.uuid})
+        with StubSmtpServer() as smtp:
+            with mock.patch("gamedoodle.core.mailing._mailer", None):
+                self.client.post(url, {"email": "alice@example.com"})
+                self.assertEqual(smtp.messages, [])
+
+                # The mail server is down at first, the Job is retried.
+                with mock.patch.object(GmailMailer, "_connect", side_effect=OSError):
+                    with self.assertLogs("gamedoodle.core.jobs", "WARNING"):
+                        self._run_due_jobs()
+                self._run_due_jobs()
+
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        self.assertEqual(len(smtp.messages), 1)
+        self.assertEqual(SentMail.objects.get().recipient, "alice@example.com")
+
+    def test_sends_email_once_if_saving_it_fails(self):
+        enqueue(send_email, recipient="alice@example.com", subject="Hi", body="")
+        with StubSmtpServer() as smtp:
+            with mock.patch("gamedoodle.core.mailing._mailer", None):
+                with mock.patch.object(
+                    SentMail.objects, "create", side_effect=DatabaseError("locked")
+                ):
+                    with self.assertLogs("gamedoodle.core.mailing", "ERROR"):
+                        self._run_due_jobs()
+                self._run_due_jobs()
+
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        self.assertEqual(len(smtp.messages), 1)
+
+    @override_settings(JOB_QUEUE={**settings.JOB_QUEUE, "MAX_ATTEMPTS": 3})
+    def test_failing_job_is_retried_until_dead(self):
+        enqueued_at = enqueue(flaky_task, num_failures=10).modified_at
+        with self.assertLogs("gamedoodle.core.jobs", "WARNING"):
+            for _ in range(4):
+                self._run_due_jobs()
 
-# Create your tests here.
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.DEAD)
+        self.assertGreater(job.modified_at, enqueued_at)
+        self.assertEqual(job.attempts, 3)
+        self.assertIn("RuntimeError: Not yet", job.last_error)
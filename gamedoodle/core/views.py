@@ -1,24 +1,56 @@
 import textwrap
+from typing import Dict
+from typing import Optional
+from typing import Set
 
-import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db.models import Q
+from django.db import transaction
+from django.http import Http404
 from django.http import HttpRequest
-from django.shortcuts import redirect, render
+from django.http import HttpResponse
+from django.http import HttpResponseBadRequest
+from django.http import HttpResponseNotAllowed
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import NoReverseMatch
 from django.urls import resolve, reverse
+from django.utils.decorators import method_decorator
 from django.views import generic
+from django.views.decorators.http import condition
 from django.views.decorators.http import require_http_methods
+from django.views.decorators.vary import vary_on_headers
 
+from gamedoodle.core.models import Activity
 from gamedoodle.core.models import Comment
 from gamedoodle.core.models import Event
-from gamedoodle.core.models import EventGame
 from gamedoodle.core.models import EventSubscription
 from gamedoodle.core.models import Game
-from gamedoodle.core.models import get_comments
-from gamedoodle.core.models import Vote
-from gamedoodle.core.mailing import send_email_via_gmail
+from gamedoodle.core.autocomplete import suggest_games
+from gamedoodle.core.caching import get_event_version
+from gamedoodle.core.comments import get_comment_page
+from gamedoodle.core.comments import get_comment_summaries
+from gamedoodle.core.comments import get_latest_comment_page
+from gamedoodle.core.conditional import event_etag
+from gamedoodle.core.conditional import event_last_modified
+from gamedoodle.core.conditional import event_list_etag
+from gamedoodle.core.conditional import event_list_last_modified
+from gamedoodle.core.jobs import enqueue
+from gamedoodle.core.jobs import get_unfinished_jobs
+from gamedoodle.core.live import get_ranks
+from gamedoodle.core.live import render_game_updates
+from gamedoodle.core.live import stream_event_updates
+from gamedoodle.core.scoreboard import build_scoreboard
+from gamedoodle.core.search import search_games
+from gamedoodle.core.steam import get_store_url
+from gamedoodle.core.tasks import enrich_game_from_steam
+from gamedoodle.core.tasks import send_email
+from gamedoodle.core.votes import add_game_to_event
+from gamedoodle.core.votes import add_vote
+from gamedoodle.core.votes import remove_vote
+from gamedoodle.core.votes import superlike_vote
+from gamedoodle.core.votes import unsuperlike_vote
 
 
 def _get_username(request):
@@ -95,6 +127,11 @@ class EventListView(generic.ListView):
     queryset = Event.objects.filter(listed=True).order_by("-created_at", "-date")[:20]
 
     @username_required
+    @method_decorator(
+        condition(
+            etag_func=event_list_etag, last_modified_func=event_list_last_modified
+        )
+    )
     def get(self, request, *args, **kargs):
         return super().get(request, *args, **kargs)
 
@@ -105,23 +142,16 @@ class EventListView(generic.ListView):
         return context
 
 
-def calculate_votes_value_for_event_and_game(game, event):
-    value = game.votes.count()
-    if game.votes.filter(is_superlike=True).exists():
-        num_event_participants = (
-            event.vote_set.all().values_list("username", flat=True).distinct().count()
-        )
-        fraction = 1 / num_event_participants
-        value += sum([fraction for _ in game.votes.filter(is_superlike=True)])
-    return value
-
-
 class EventDetailView(generic.DetailView):
     model = Event
     slug_url_kwarg = "uuid"
     slug_field = "uuid"
 
     @username_required
+    @method_decorator(vary_on_headers("HX-Request"))
+    @method_decorator(
+        condition(etag_func=event_etag, last_modified_func=event_last_modified)
+    )
     def get(self, request, *args, **kargs):
         return super().get(request, *args, **kargs)
 
@@ -134,45 +164,21 @@ class EventDetailView(generic.DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        event = self.get_object()
-        event.comments = get_comments(event)
-
+        event = self.object
         username = _get_username(self.request)
-        games = list(event.games.all())
+        event_version = get_event_version(event.id)
+        games = build_scoreboard(event, username, event_version)
 
         subscribed = self.request.GET.get("subscribed") == "true"
         unsubscribed = self.request.GET.get("unsubscribed") == "true"
         scroll_to_game_id = self.request.GET.get("game", None)
 
-        event.comments = get_comments(event)
-
-        for game in games:
-            game.comments = game.get_comments_for_event(event)
-
-            votes = game.get_votes_for_event(event)
-            game.votes = votes
-            game.votes_value = calculate_votes_value_for_event_and_game(game, event)
-            game.current_user_can_vote = not votes.filter(username=username).exists()
-            game.current_user_can_superlike = (
-                votes.filter(username=username, is_superlike=False).exists()
-                and not Vote.objects.filter(
-                    event=event, username=username, is_superlike=True
-                ).exists()
-            )
-            game.added_by_username = game.get_added_by_username_for_event(event)
-
-        games = sorted(
-            games, key=lambda game: f"{game.votes_value}-{game.name}", reverse=True
-        )
-        sorted_unique_votes_value = sorted(
-            list(set([game.votes_value for game in games])), reverse=True
-        )
-        for game in games:
-            game.voting_rank = sorted_unique_votes_value.index(game.votes_value) + 1
-
         context["event"] = event
         context["username"] = username
         context["games"] = games
+        context["event_version"] = event_version
+        context["fragment_cache_timeout"] = settings.EVENT_FRAGMENT_CACHE_TIMEOUT
+        context["polling_game_ids"] = _get_polling_game_ids(games)
 
         context["subscribed"] = subscribed
         context["unsubscribed"] = unsubscribed
@@ -183,6 +189,112 @@ class EventDetailView(generic.DetailView):
         return context
 
 
+async def event_live_updates(request, uuid):
+    """Stream changes of an Event as Server-Sent Events.
+
+    This is async so idle connections do not block a worker thread,
+    which requires serving gamedoodle.asgi:application.
+
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(("GET",))
+
+    username = await sync_to_async(_get_username)(request)
+    if not username:
+        # Tells the EventSource to stop reconnecting.
+        return HttpResponse(status=204)
+
+    try:
+        event = await Event.objects.aget(uuid=uuid)
+    except Event.DoesNotExist:
+        raise Http404
+
+    return StreamingHttpResponse(
+        stream_event_updates(event, username),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _get_polling_game_ids(games) -> Set[int]:
+    """Ids of given Games whose cards poll for details from Steam.
+
+    Only needed without redis, otherwise the worker's live updates reach
+    the cards, see settings.LIVE_UPDATES.
+
+    """
+    if settings.LIVE_UPDATES["REDIS_URL"]:
+        return set()
+    # The image is the first detail fetched, most cards skip the query.
+    game_ids = [game.id for game in games if game.appid and not game.image_url]
+    if not game_ids:
+        return set()
+    return set(
+        get_unfinished_jobs(enrich_game_from_steam)
+        .filter(kwargs__game_id__in=game_ids)
+        .values_list("kwargs__game_id", flat=True)
+    )
+
+
+@require_http_methods(("GET",))
+@username_required
+def game_card(request, uuid, game_id):
+    """Render the card of a single Game on an Event.
+
+    Polled by cards of Games whose details are still fetched from Steam,
+    up to settings.LIVE_UPDATES["POLL_ATTEMPTS"] times.
+
+    """
+    event = get_object_or_404(Event, uuid=uuid)
+    try:
+        attempt = int(request.GET.get("attempt", 0))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid attempt")
+
+    username = _get_username(request)
+    event_version = get_event_version(event.id)
+    games = build_scoreboard(event, username, event_version)
+    game = next((game for game in games if game.id == game_id), None)
+    if game is None:
+        raise Http404
+
+    polling_game_ids = set()
+    if attempt < settings.LIVE_UPDATES["POLL_ATTEMPTS"]:
+        polling_game_ids = _get_polling_game_ids([game])
+    return render(
+        request,
+        "core/event_game_card.html",
+        {
+            "event": event,
+            "game": game,
+            "username": username,
+            "event_version": event_version,
+            "fragment_cache_timeout": settings.EVENT_FRAGMENT_CACHE_TIMEOUT,
+            "polling_game_ids": polling_game_ids,
+            "poll_attempt": attempt + 1,
+        },
+    )
+
+
+def _render_game_updates(
+    event: Event, username: str, game_ids: Set[int], ranks_before: Dict[int, int]
+) -> HttpResponse:
+    """Respond with htmx out-of-band swaps for what changed.
+
+    These are the cards of given Games, the rank labels of other Games
+    whose rank differs from ranks_before and the order of the cards,
+    so a click does not render the whole scoreboard. If the number of
+    participants changed, the page reloads its content instead.
+
+    """
+    updates = render_game_updates(
+        event, username, game_ids, ranks_before, swap_oob=True
+    )
+    if updates is None:
+        return HttpResponse(headers={"HX-Trigger": "event-changed"})
+    return HttpResponse("".join(html for _, html in updates))
+
+
 @require_http_methods(("GET",))
 @username_required
 def setup_email_notifications(request, uuid):
@@ -219,7 +331,9 @@ def subscribe_to_email_notifications(request, uuid):
         reverse("event-notifications-unsubscribe", args=[subscription.uuid])
     )
 
-    send_email_via_gmail(
+    # Sent by the worker, so a slow mail server does not block the request.
+    enqueue(
+        send_email,
         recipient=email,
         subject=f'[gamedoodle] Please confirm subscription for "{event.name}"',
         body=textwrap.dedent(
@@ -277,105 +391,139 @@ def vote_game(request, uuid):
     _raise_if_event_not_writable(event)
 
     username = _get_username(request)
+    ranks_before = get_ranks(event) if request.htmx else None
+
+    voted_for_game_id = None
 
     vote_id = request.POST.get("vote_id")
-    voted_for_game = None
     if vote_id:
-        vote = Vote.objects.get(id=vote_id)
-        voted_for_game = vote.game
-        if vote.username == username:
-            vote.delete()
+        vote = remove_vote(event, vote_id, username)
+        if vote is not None:
+            voted_for_game_id = vote.game_id
 
     superlike_vote_id = request.POST.get("superlike_vote_id")
     if superlike_vote_id:
-        vote = Vote.objects.get(id=superlike_vote_id)
-        voted_for_game = vote.game
-        if vote.username == username:
-            vote.is_superlike = False
-            vote.save()
+        vote = unsuperlike_vote(event, superlike_vote_id, username)
+        if vote is not None:
+            voted_for_game_id = vote.game_id
 
     game_id = request.POST.get("game_id")
     if game_id:
-        vote, _ = Vote.objects.get_or_create(
-            event=event, game_id=game_id, username=username
-        )
-        voted_for_game = vote.game
+        voted_for_game_id = int(game_id)
+        add_vote(event, game_id, username)
 
     superlike_game_id = request.POST.get("superlike_game_id")
     if superlike_game_id:
-        vote = Vote.objects.get(
-            event=event, game_id=superlike_game_id, username=username
+        voted_for_game_id = int(superlike_game_id)
+        superlike_vote(event, superlike_game_id, username)
+
+    if request.htmx:
+        return _render_game_updates(
+            event, username, {voted_for_game_id}, ranks_before
         )
-        voted_for_game = vote.game
-        vote.is_superlike = True
-        vote.save()
 
     url = reverse("event-detail", kwargs={"uuid": uuid})
-    if voted_for_game:
-        query_params = f"?game={voted_for_game.id}"
-        url += query_params
-
+    if voted_for_game_id:
+        url += f"?game={voted_for_game_id}"
     return redirect(url)
 
 
 @require_http_methods(("GET", "POST"))
 @username_required
+@vary_on_headers("HX-Request")
+@condition(etag_func=event_etag, last_modified_func=event_last_modified)
 def add_comment(request, uuid):
     username = _get_username(request)
     event = Event.objects.get(uuid=uuid)
 
     try:
         game = Game.objects.get(id=request.GET["game"])
-        comments = game.get_comments_for_event(event)
     except KeyError:
         game = None
-        comments = get_comments(event)
 
     if request.method == "POST":
         _raise_if_event_not_writable(event)
         new_comment = request.POST["new-comment"].strip()
         if new_comment:
-            Comment.objects.create(
-                event=event,
-                game=game,
-                username=username,
-                text=new_comment,
-            )
-            if request.htmx:
-                if game:
-                    comments = game.get_comments_for_event(event)
-                else:
-                    comments = get_comments(event)
-
-                return render(
-                    request,
-                    "core/event_add_comment_content.html",
-                    {
-                        "event": event,
-                        "game": game,
-                        "comments": comments,
-                        "username": username,
+            with transaction.atomic():
+                comment = Comment.objects.create(
+                    event=event,
+                    game=game,
+                    username=username,
+                    text=new_comment,
+                )
+                Activity.objects.create(
+                    event=event,
+                    kind=Activity.COMMENT,
+                    actor=username,
+                    game=game,
+                    payload={
+                        "comment_id": comment.id,
+                        "preview": comment.short_preview,
                     },
                 )
-            return redirect(request.build_absolute_uri())
+            if not request.htmx:
+                return redirect(request.build_absolute_uri())
+            return _render_comments(request, event, game, username)
+
+    return _render_comments(
+        request, event, game, username, "core/event_add_comment.html"
+    )
 
+
+def _render_comments(
+    request,
+    event: Event,
+    game: Optional[Game],
+    username: str,
+    template_name: str = "core/event_add_comment_content.html",
+):
+    game_id = game.id if game else None
+    comment_summaries = get_comment_summaries(event, [game_id], num_latest=0)
     return render(
         request,
-        "core/event_add_comment.html",
+        template_name,
         {
             "event": event,
             "game": game,
-            "comments": comments,
+            "comment_page": get_latest_comment_page(request, event, game),
+            "comment_summary": comment_summaries[game_id],
             "username": username,
         },
     )
 
 
+@require_http_methods(("GET",))
+@username_required
+def older_comments(request, uuid):
+    """Render the comments before the cursor in ?before, for "load older"."""
+    event = get_object_or_404(Event, uuid=uuid)
+    game = None
+    if request.GET.get("game"):
+        game = get_object_or_404(Game, id=request.GET["game"])
+
+    try:
+        comment_page = get_comment_page(event, game, before=request.GET["before"])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("Expected ?before=<cursor>")
+
+    return render(
+        request,
+        "core/event_comment_page.html",
+        {
+            "event": event,
+            "game": game,
+            "comment_page": comment_page,
+            "username": _get_username(request),
+        },
+    )
+
+
 @require_http_methods(("POST",))
 @username_required
 def delete_comment(request, comment_id):
     username = _get_username(request)
-    comment = Comment.objects.get(id=comment_id)
+    comment = Comment.objects.select_related("event", "game").get(id=comment_id)
     if comment.username != username:
         raise ValidationError(
             f"{username} not allowed to delete "
@@ -387,22 +535,7 @@ def delete_comment(request, comment_id):
     comment.save(update_fields=["softdeleted"])
 
     if request.htmx:
-        if comment.game:
-            game = comment.game
-            comments = game.get_comments_for_event(comment.event)
-        else:
-            game = None
-            comments = get_comments(comment.event)
-        return render(
-            request,
-            "core/event_add_comment_content.html",
-            {
-                "event": comment.event,
-                "game": game,
-                "comments": comments,
-                "username": username,
-            },
-        )
+        return _render_comments(request, comment.event, comment.game, username)
 
     add_comment_url = (
         reverse("event-add-comment", args=(comment.event.uuid,))
@@ -427,16 +560,7 @@ def add_game(request, uuid):
     search_text = request.GET.get("q", "").strip()
     matching_games = []
     if search_text:
-        full_text_query = Q(name__icontains=search_text)
-        words_query = Q()
-        for word in search_text.split(" "):
-            words_query &= Q(name__icontains=word)
-
-        matching_games = Game.objects.filter(
-            full_text_query | words_query
-        ).order_by(
-            "name"
-        )[:100]
+        matching_games = search_games(search_text, limit=100)
 
     return render(
         request,
@@ -445,6 +569,24 @@ def add_game(request, uuid):
     )
 
 
+@require_http_methods(("GET",))
+@username_required
+def add_game_autocomplete(request, uuid):
+    """Suggest Games while typing into the search on the add_game page."""
+    event = Event.objects.get(uuid=uuid)
+
+    search_text = request.GET.get("q", "").strip()
+    matching_games = []
+    if search_text:
+        matching_games = suggest_games(search_text, limit=20)
+
+    return render(
+        request,
+        "core/event_add_game_results.html",
+        {"event": event, "matching_games": matching_games, "search_text": search_text},
+    )
+
+
 @require_http_methods(("POST",))
 @username_required
 def add_game_manually(request, uuid):
@@ -468,10 +610,7 @@ def add_game_manually(request, uuid):
 
     username = _get_username(request)
 
-    event_game, created = EventGame.objects.get_or_create(event=event, game=game)
-    if created and username:
-        event_game.added_by_username = username
-        event_game.save(update_fields=["added_by_username"])
+    add_game_to_event(event, game, username)
 
     # Scroll to Game after it has been added.
     query_params = f"?game={game.id}"
@@ -479,9 +618,7 @@ def add_game_manually(request, uuid):
 
     # Ensure user also voted for the Game.
     if username:
-        Vote.objects.get_or_create(
-            event=event, game_id=game.id, username=username
-        )
+        add_vote(event, game.id, username)
 
     return redirect(url)
 
@@ -501,34 +638,18 @@ def add_matching_game(request, uuid):
     game_id = request.POST["game_id"]
     game = Game.objects.get(id=game_id)
 
-    is_steam_game = game.appid is not None
-    if is_steam_game:
-        steam_appid_str = str(game.appid)
+    # The store url only needs the appid, fetch the other details in the
+    # background. The card of the Game is updated live or polls for them,
+    # see game_card().
+    if game.appid is not None:
         if not game.store_url:
-            game.store_url = settings.STEAM_STORE_PAGE_BASE_URL + steam_appid_str
-            game.save()
-
-        # Fetch to set/update details.
-        url = settings.STEAM_API_BASE_URL_APPDETAILS + steam_appid_str
-        response = requests.get(url)
-
-        raw: dict = response.json()[steam_appid_str]
-        data: dict = raw["data"]
-
-        screenshots = data.get("screenshots", [])
-        if game.image_url == "" and screenshots:
-            first_thumbnail = screenshots[0]["path_thumbnail"]
-            game.image_url = first_thumbnail
-
-        game.is_free = data["is_free"]
-        game.save()
+            game.store_url = get_store_url(game.appid)
+            game.save(update_fields=["store_url", "modified_at"])
+        enqueue(enrich_game_from_steam, game_id=game.id)
 
     username = _get_username(request)
 
-    event_game, created = EventGame.objects.get_or_create(event=event, game=game)
-    if created and username:
-        event_game.added_by_username = username
-        event_game.save(update_fields=["added_by_username"])
+    add_game_to_event(event, game, username)
 
     # Scroll to Game after it has been added.
     query_params = f"?game={game.id}"
@@ -536,8 +657,6 @@ def add_matching_game(request, uuid):
 
     # Ensure user also voted for the Game.
     if username:
-        Vote.objects.get_or_create(
-            event=event, game_id=game.id, username=username
-        )
+        add_vote(event, game.id, username)
 
     return redirect(url)
@@ -0,0 +1,164 @@
+"""Voting in single statements, safe against concurrent clicks.
+
+Each change is logged as Activity in the same transaction, so there is
+an Activity exactly for the changes that were committed.
+
+"""
+from typing import Optional
+from typing import Tuple
+
+from django.db import IntegrityError
+from django.db import connection
+from django.db import transaction
+from django.db.models import Exists
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from gamedoodle.core.models import Activity
+from gamedoodle.core.models import Event
+from gamedoodle.core.models import EventGame
+from gamedoodle.core.models import Game
+from gamedoodle.core.models import Vote
+
+
+def add_vote(event: Event, game_id: int, username: str) -> Optional[Vote]:
+    """Vote for a Game of an Event, return None if voted already.
+
+    Uses INSERT ... ON CONFLICT DO NOTHING (SQLite and PostgreSQL), so
+    a double click can not fail on the unique constraint, and only
+    inserts if the Game belongs to the Event.
+
+    """
+    now = timezone.now()
+    db_now = connection.ops.adapt_datetimefield_value(now)
+    # Count it in the same transaction, see gamedoodle.core.counters.
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO core_vote
+                    (created_at, modified_at, event_id, game_id, username, is_superlike)
+                SELECT %s, %s, %s, %s, %s, FALSE
+                WHERE EXISTS (
+                    SELECT 1 FROM core_eventgame WHERE event_id = %s AND game_id = %s
+                )
+                ON CONFLICT (event_id, game_id, username) DO NOTHING
+                RETURNING id
+                """,
+                [db_now, db_now, event.id, game_id, username, event.id, game_id],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+
+        vote = Vote(
+            id=row[0],
+            created_at=now,
+            modified_at=now,
+            event=event,
+            game_id=game_id,
+            username=username,
+        )
+        _send_post_save(vote, created=True)
+        Activity.objects.create(
+            event=event, kind=Activity.VOTE, actor=username, game_id=game_id
+        )
+        return vote
+
+
+def remove_vote(event: Event, vote_id: int, username: str) -> Optional[Vote]:
+    """Remove a Vote of the user, return None if there is none (anymore)."""
+    with transaction.atomic():
+        # Concurrent removals wait here and then find nothing.
+        vote = (
+            Vote.objects.select_for_update()
+            .filter(id=vote_id, event=event, username=username)
+            .first()
+        )
+        if vote is None:
+            return None
+        vote.delete()
+        Activity.objects.create(
+            event=event, kind=Activity.UNVOTE, actor=username, game_id=vote.game_id
+        )
+    return vote
+
+
+def superlike_vote(event: Event, game_id: int, username: str) -> Optional[Vote]:
+    """Superlike the Vote of the user for a Game, return None if not allowed.
+
+    A single conditional UPDATE only succeeds if the user has voted for
+    the Game and has not superliked any Game of the Event yet. The
+    "unique superlike" constraint rejects the loser of concurrent clicks.
+
+    """
+    has_superliked = Vote.objects.filter(
+        event=event, username=username, is_superlike=True
+    )
+    try:
+        with transaction.atomic():
+            num_updated = (
+                Vote.objects.filter(
+                    event=event, game_id=game_id, username=username, is_superlike=False
+                )
+                .filter(~Exists(has_superliked))
+                .update(is_superlike=True, modified_at=timezone.now())
+            )
+            if not num_updated:
+                return None
+
+            vote = Vote.objects.get(event=event, game_id=game_id, username=username)
+            _send_post_save(
+                vote, update_fields=frozenset({"is_superlike", "modified_at"})
+            )
+            Activity.objects.create(
+                event=event, kind=Activity.SUPERLIKE, actor=username, game_id=game_id
+            )
+    except IntegrityError:
+        return None
+    return vote
+
+
+def unsuperlike_vote(event: Event, vote_id: int, username: str) -> Optional[Vote]:
+    """Take back the superlike of a Vote, return None if it has none."""
+    with transaction.atomic():
+        num_updated = Vote.objects.filter(
+            id=vote_id, event=event, username=username, is_superlike=True
+        ).update(is_superlike=False, modified_at=timezone.now())
+        if not num_updated:
+            return None
+
+        vote = Vote.objects.get(id=vote_id)
+        _send_post_save(vote, update_fields=frozenset({"is_superlike", "modified_at"}))
+        Activity.objects.create(
+            event=event, kind=Activity.UNSUPERLIKE, actor=username, game_id=vote.game_id
+        )
+    return vote
+
+
+def add_game_to_event(
+    event: Event, game: Game, username: str
+) -> Tuple[EventGame, bool]:
+    """Add a Game to an Event if not added yet, return it and whether it was."""
+    with transaction.atomic():
+        event_game, created = EventGame.objects.get_or_create(
+            event=event, game=game, defaults={"added_by_username": username}
+        )
+        if created:
+            Activity.objects.create(
+                event=event, kind=Activity.ADD_GAME, actor=username, game=game
+            )
+    return event_game, created
+
+
+def _send_post_save(vote: Vote, created=False, update_fields=None):
+    # Queries bypass Model.save(), but receivers still need to know,
+    # e.g. to invalidate cached fragments.
+    post_save.send(
+        sender=Vote,
+        instance=vote,
+        created=created,
+        update_fields=update_fields,
+        raw=False,
+        using=connection.alias,
+    )
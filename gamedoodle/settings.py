@@ -59,6 +59,7 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    "gamedoodle.core.instrumentation.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -95,13 +96,150 @@ WSGI_APPLICATION = "gamedoodle.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# SQLite by default. Set DATABASE_ENGINE=postgresql to run several
+# workers on more than one host, see the copy_sqlite_to_postgres command.
+DATABASE_ENGINE = config("DATABASE_ENGINE", default="sqlite3")
+
+# Connections are closed after each request by default. The app runs as
+# ASGI (see gamedoodle.service), where Django 4.2 runs every sync view in
+# a new thread, so persistent connections would never be reused and pile
+# up until they time out (https://code.djangoproject.com/ticket/33497).
+# Opening a SQLite connection is cheap, for PostgreSQL put pgbouncer in
+# front (DATABASE_PGBOUNCER) to pool connections. Only set
+# DATABASE_CONN_MAX_AGE when running as WSGI.
+DATABASE_CONN_MAX_AGE = config("DATABASE_CONN_MAX_AGE", cast=int, default=0)
+
+if DATABASE_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": config("DATABASE_NAME", default="gamedoodle"),
+            "USER": config("DATABASE_USER", default="gamedoodle"),
+            "PASSWORD": config("DATABASE_PASSWORD", default=""),
+            "HOST": config("DATABASE_HOST", default="localhost"),
+            "PORT": config("DATABASE_PORT", default="5432"),
+            "CONN_MAX_AGE": DATABASE_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            # Required when connecting through pgbouncer in transaction
+            # pooling mode, which does not keep cursors across transactions.
+            "DISABLE_SERVER_SIDE_CURSORS": config(
+                "DATABASE_PGBOUNCER", cast=bool, default=False
+            ),
+            "OPTIONS": {
+                "connect_timeout": 5,
+                "application_name": "gamedoodle",
+            },
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": config("DATABASE_NAME", default=str(BASE_DIR / "db.sqlite3")),
+            "CONN_MAX_AGE": DATABASE_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+        }
     }
+
+# Applied to each new SQLite connection, see gamedoodle.core.signals.
+# WAL lets readers and a writer work at the same time, writers wait for
+# each other up to busy_timeout instead of failing with "database is
+# locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",  # Safe with WAL, only fsyncs on checkpoints.
+    "busy_timeout": config("SQLITE_BUSY_TIMEOUT_MS", cast=int, default=5000),
+    "mmap_size": config("SQLITE_MMAP_SIZE", cast=int, default=256 * 1024 * 1024),
+    "cache_size": -20_000,  # Negative means KiB, so about 20 MB.
+    "temp_store": "memory",
+}
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+#
+# The local-memory backend evicts least recently used entries once
+# MAX_ENTRIES is reached. Versions of Events are kept in files instead,
+# so changes from other processes (e.g. the run_worker command) are seen
+# by the web workers as well. Use a shared backend like redis for both
+# when running on more than one host.
+
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": config("CACHE_LOCATION", default="gamedoodle"),
+        "OPTIONS": {
+            "MAX_ENTRIES": config("CACHE_MAX_ENTRIES", cast=int, default=5000),
+        },
+    },
+    "event-versions": {
+        "BACKEND": config(
+            "EVENT_VERSIONS_CACHE_BACKEND",
+            default="django.core.cache.backends.filebased.FileBasedCache",
+        ),
+        "LOCATION": config(
+            "EVENT_VERSIONS_CACHE_LOCATION",
+            default=str(BASE_DIR / ".cache" / "event-versions"),
+        ),
+        "OPTIONS": {
+            "MAX_ENTRIES": 10000,
+        },
+    },
+}
+
+# Seconds to keep rendered Event fragments in the cache.
+EVENT_FRAGMENT_CACHE_TIMEOUT = config(
+    "EVENT_FRAGMENT_CACHE_TIMEOUT", cast=int, default=60 * 60 * 24
+)
+
+# Server-Sent Events with live updates for Event pages, requires running
+# the ASGI application. Set REDIS_URL to share updates between multiple
+# worker processes (requires the redis package).
+LIVE_UPDATES = {
+    "REDIS_URL": config("LIVE_UPDATES_REDIS_URL", default=""),
+    "KEEPALIVE_SECONDS": 15,
+    "MAX_SECONDS": 60 * 10,
+    "QUEUE_SIZE": 100,
+    # Without redis the run_worker process can not reach connected
+    # clients, so cards of Games whose details are still fetched from
+    # Steam poll for them this many times instead.
+    "POLL_ATTEMPTS": 10,
+}
+
+# In-memory autocomplete for Game names, see gamedoodle.core.autocomplete.
+AUTOCOMPLETE = {
+    "MAX_NAME_LENGTH": 64,
+    "REFRESH_SECONDS": 60,
 }
 
+# Background jobs, see gamedoodle.core.jobs and the run_worker command.
+JOB_QUEUE = {
+    "CONCURRENCY": config("JOB_QUEUE_CONCURRENCY", cast=int, default=2),
+    "MAX_ATTEMPTS": 5,
+    "RETRY_BACKOFF_SECONDS": 10,  # Doubled for each further attempt.
+    "POLL_SECONDS": 1,
+    "STALE_SECONDS": 60 * 10,
+}
+
+# Server-Timing headers and a log line with the number of queries and
+# timings of each request, see gamedoodle.core.instrumentation. Budgets
+# are the maximum number of queries per request by URL name, always
+# enforced when running the tests.
+INSTRUMENTATION = {
+    "ENABLED": config("INSTRUMENTATION_ENABLED", cast=bool, default=False),
+    "ENFORCE_QUERY_BUDGETS": False,
+    "QUERY_BUDGETS": {
+        "event-detail": 10,
+        "event-game-card": 8,
+        "event-vote-game": 24,
+        "event-add-comment": 12,
+        "event-older-comments": 5,
+    },
+}
+TEST_RUNNER = "gamedoodle.core.instrumentation.QueryBudgetTestRunner"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -166,12 +304,39 @@ STEAM_API_URL_GET_APP_LIST = (
 )
 STEAM_STORE_PAGE_BASE_URL = "https://store.steampowered.com/app/"  # + appid
 STEAM_API_BASE_URL_APPDETAILS = "https://store.steampowered.com/api/appdetails/?appids="
+STEAM_API_TIMEOUT_SECONDS = 5
+STEAM_API_RETRIES = 3
+STEAM_API_BACKOFF_FACTOR = 0.5
+STEAM_APP_DETAILS_CACHE_SECONDS = 60 * 60 * 24 * 7
 
 EMAIL_NOTIFICATIONS = {
     "GMAIL_SMTP_SERVER": config("GMAIL_SMTP_SERVER", default="smtp.gmail.com"),
     "GMAIL_SMTP_PORT": config("GMAIL_SMTP_PORT", cast=int, default=587),
     "GMAIL_USER": config("GMAIL_USER", default="no-gmail-user-set"),
     "GMAIL_PWD": config("GMAIL_PWD", default="no-gmail-password-set"),
+    "GMAIL_USE_TLS": config("GMAIL_USE_TLS", cast=bool, default=True),
+    "GMAIL_SMTP_TIMEOUT_SECONDS": 30,
+}
+
+# What the compact_history command keeps, see gamedoodle.core.retention.
+RETENTION = {
+    "POLICIES": {
+        "SentMail": {
+            "MAX_AGE_DAYS": 90,
+            "MAX_ROWS": 10_000,
+            "KEEP_LAST_PER_RECIPIENT": 5,
+        },
+        "CRUDEvent": {
+            "MAX_AGE_DAYS": 180,
+            "MAX_ROWS": 100_000,
+        },
+        "Activity": {
+            "MAX_AGE_DAYS": 365,
+            "MAX_ROWS": 1_000_000,
+        },
+    },
+    "ARCHIVE_DIR": config("RETENTION_ARCHIVE_DIR", default=str(BASE_DIR / "archive")),
+    "BATCH_SIZE": 500,
 }
 
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 356  # One year in seconds
@@ -23,8 +23,23 @@ urlpatterns = [
     path("whoareyou/", views.who_are_you, name="who-are-you"),
     path("logout/", views.logout, name="logout"),
     path("events/<uuid:uuid>", views.EventDetailView.as_view(), name="event-detail"),
+    path(
+        "events/<uuid:uuid>/live",
+        views.event_live_updates,
+        name="event-live-updates",
+    ),
+    path(
+        "events/<uuid:uuid>/games/<int:game_id>/card",
+        views.game_card,
+        name="event-game-card",
+    ),
     path("events/<uuid:uuid>/votegame", views.vote_game, name="event-vote-game"),
     path("events/<uuid:uuid>/addgame", views.add_game, name="event-add-game"),
+    path(
+        "events/<uuid:uuid>/addgame/autocomplete",
+        views.add_game_autocomplete,
+        name="event-add-game-autocomplete",
+    ),
     path(
         "events/<uuid:uuid>/notifications",
         views.setup_email_notifications,
@@ -50,6 +65,11 @@ urlpatterns = [
         views.add_comment,
         name="event-add-comment",
     ),
+    path(
+        "events/<uuid:uuid>/comments/older",
+        views.older_comments,
+        name="event-older-comments",
+    ),
     path(
         "comments/<int:comment_id>/delete",
         views.delete_comment,